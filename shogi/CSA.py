@@ -60,6 +60,21 @@ SERVER_MESSAGES = [
     TORYO, KACHI
 ] = range(0, len(SERVER_MESSAGE_SYMBOLS))
 
+def repetition_server_messages(board, color=None):
+    '''
+    Gets the server messages ending the game by fourfold repetition of the
+    current position, as sent to the player of `color` (the side to move by
+    default): `[SENNICHITE, DRAW]`, `[OUTE_SENNICHITE, WIN]` or
+    `[OUTE_SENNICHITE, LOSE]`. Returns `None` if the game goes on.
+    '''
+    repetition = board.repetition()
+    if repetition == shogi.REPETITION_DRAW:
+        return [SENNICHITE, DRAW]
+    if repetition in (shogi.REPETITION_WIN, shogi.REPETITION_LOSE):
+        won = (repetition == shogi.REPETITION_WIN) == (color is None or color == board.turn)
+        return [OUTE_SENNICHITE, WIN if won else LOSE]
+    return None
+
 class Parser:
     @staticmethod
     def parse_file(path):
@@ -7,6 +7,11 @@ from __future__ import unicode_literals
 #       and opposite direction of files and ranks like '9i'.
 #       We use chess style notation internally, but exports it with this table.
 
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 from .Piece import *
 
 SQUARE_NAMES = [
@@ -21,29 +26,93 @@ SQUARE_NAMES = [
     '9i', '8i', '7i', '6i', '5i', '4i', '3i', '2i', '1i',
 ]
 
+# Moves can also be packed into 16 bit integers, the same value as
+# `Move.__hash__`: to_square | from_square << 7 | promotion << 14, where drops
+# use 81 + drop_piece_type as from_square. 0 would be a move from 9a to 9a,
+# so it stands for the null move.
+MOVE_INT_NULL = 0
+
+SQUARE_NAME_INDEXES = dict((name, square) for square, name in enumerate(SQUARE_NAMES))
+
+def move_int_to_usi(move_int):
+    '''
+    Gets an USI string for a packed move.
+    '''
+    if not move_int:
+        return '0000'
+    to_square = move_int & 127
+    from_square = (move_int >> 7) & 127
+    if from_square >= 81:
+        return PIECE_SYMBOLS[from_square - 81].upper() + '*' + SQUARE_NAMES[to_square]
+    elif move_int >> 14:
+        return SQUARE_NAMES[from_square] + SQUARE_NAMES[to_square] + '+'
+    else:
+        return SQUARE_NAMES[from_square] + SQUARE_NAMES[to_square]
+
+def move_int_from_usi(usi):
+    '''
+    Parses an USI string into a packed move.
+    Raises `ValueError` if the USI string is invalid.
+    '''
+    try:
+        if usi == '0000':
+            return MOVE_INT_NULL
+        elif len(usi) == 4:
+            if usi[1] == '*':
+                piece = Piece.from_symbol(usi[0])
+                return SQUARE_NAME_INDEXES[usi[2:4]] | (81 + piece.piece_type) << 7
+            else:
+                return SQUARE_NAME_INDEXES[usi[2:4]] | SQUARE_NAME_INDEXES[usi[0:2]] << 7
+        elif len(usi) == 5 and usi[4] == '+':
+            return SQUARE_NAME_INDEXES[usi[2:4]] | SQUARE_NAME_INDEXES[usi[0:2]] << 7 | 1 << 14
+    except KeyError:
+        raise ValueError('invalid square in usi string: {0}'.format(repr(usi)))
+    raise ValueError('expected usi string to be of length 4 or 5')
+
+def move_from_int(move_int):
+    '''
+    Gets the move for a packed integer, see `Move.from_int()`.
+    '''
+    return Move.from_int(move_int)
+
 class Move(object):
     '''
     Represents a move from a square to a square and possibly the promotion piece
     type.
     Null moves are supported.
+    Moves are immutable, since the instances of the registry are shared.
     '''
 
+    __slots__ = ('from_square', 'to_square', 'promotion', 'drop_piece_type', '_usi')
+
     def __init__(self, from_square, to_square, promotion=False, drop_piece_type=None):
         # if from_square is None, it's a drop and
-        self.from_square = from_square
-        self.to_square = to_square
         if from_square is None and to_square is not None:
             if drop_piece_type is None:
                 raise ValueError('Drop piece type must be set.')
             if promotion:
                 raise ValueError('Cannot set promoted piece.')
-            self.promotion = False
-            self.drop_piece_type = drop_piece_type
+            promotion = False
         else:
-            self.promotion = promotion
             if drop_piece_type:
                 raise ValueError('Drop piece type must not be set.')
-            self.drop_piece_type = None
+            drop_piece_type = None
+
+        set_slot = object.__setattr__
+        set_slot(self, '_usi', None)
+        set_slot(self, 'from_square', from_square)
+        set_slot(self, 'to_square', to_square)
+        set_slot(self, 'promotion', promotion)
+        set_slot(self, 'drop_piece_type', drop_piece_type)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Move is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Move is immutable')
+
+    def __reduce__(self):
+        return (move_from_int, (self.to_int(), ))
 
     def usi(self):
         '''
@@ -51,14 +120,18 @@ class Move(object):
         For example a move from 7A to 8A would be `7a8a` or `7a8a+` if it is
         a promotion.
         '''
-        if self:
-            if self.drop_piece_type:
-                return '{0}*{1}'.format(PIECE_SYMBOLS[self.drop_piece_type].upper(), SQUARE_NAMES[self.to_square])
+        usi = self._usi
+        if usi is None:
+            if self:
+                if self.drop_piece_type:
+                    usi = '{0}*{1}'.format(PIECE_SYMBOLS[self.drop_piece_type].upper(), SQUARE_NAMES[self.to_square])
+                else:
+                    usi = SQUARE_NAMES[self.from_square] + SQUARE_NAMES[self.to_square] + \
+                          ('+' if self.promotion else '')
             else:
-                return SQUARE_NAMES[self.from_square] + SQUARE_NAMES[self.to_square] + \
-                       ('+' if self.promotion else '')
-        else:
-            return '0000'
+                usi = '0000'
+            object.__setattr__(self, '_usi', usi)
+        return usi
 
     def __bool__(self):
         return not bool(self.from_square is None and self.to_square is None)
@@ -83,32 +156,77 @@ class Move(object):
         return self.usi()
 
     def __hash__(self):
+        return self.to_int()
+
+    def to_int(self):
+        '''
+        Gets the move packed into a 16 bit integer.
+        '''
         # 7 bit is enough to represent 81 patterns
         if self.drop_piece_type is None:
+            if self.from_square is None:
+                return MOVE_INT_NULL
             return self.to_square | self.from_square << 7 | self.promotion << 14
         else:
             # drop piece
             return self.to_square | (81 + self.drop_piece_type) << 7
 
+    @classmethod
+    def from_int(cls, move_int):
+        '''
+        Gets the move for a packed integer made by `to_int()`.
+        '''
+        move = MOVES_BY_INT[move_int]
+        if move is not None:
+            return move
+        if not move_int:
+            return cls.null()
+        from_square = (move_int >> 7) & 127
+        if from_square >= 81:
+            return cls(None, move_int & 127, False, from_square - 81)
+        return cls(from_square, move_int & 127, bool(move_int >> 14))
+
     @classmethod
     def from_usi(cls, usi):
         '''
         Parses an USI string.
         Raises `ValueError` if the USI string is invalid.
         '''
+        move = MOVES_BY_USI.get(usi)
+        if move is not None:
+            return move
         if usi == '0000':
             return cls.null()
         elif len(usi) == 4:
             if usi[1] == '*':
                 piece = Piece.from_symbol(usi[0])
-                return cls(None, SQUARE_NAMES.index(usi[2:4]), False, piece.piece_type)
+                return cls.get(None, SQUARE_NAMES.index(usi[2:4]), False, piece.piece_type)
             else:
-                return cls(SQUARE_NAMES.index(usi[0:2]), SQUARE_NAMES.index(usi[2:4]))
+                return cls.get(SQUARE_NAMES.index(usi[0:2]), SQUARE_NAMES.index(usi[2:4]))
         elif len(usi) == 5 and usi[4] == '+':
-            return cls(SQUARE_NAMES.index(usi[0:2]), SQUARE_NAMES.index(usi[2:4]), True)
+            return cls.get(SQUARE_NAMES.index(usi[0:2]), SQUARE_NAMES.index(usi[2:4]), True)
         else:
             raise ValueError('expected usi string to be of length 4 or 5')
 
+    @classmethod
+    def get(cls, from_square, to_square, promotion=False, drop_piece_type=None):
+        '''
+        Gets the shared instance of a move. Moves which are not in the
+        registry, like ones from and to the same square, are created.
+        '''
+        if drop_piece_type:
+            if from_square is None and to_square is not None and not promotion:
+                move = MOVES_BY_INT[to_square | (81 + drop_piece_type) << 7]
+                if move is not None:
+                    return move
+        elif from_square is not None and to_square is not None:
+            move = MOVES_BY_INT[to_square | from_square << 7 | bool(promotion) << 14]
+            if move is not None:
+                return move
+        elif from_square is None and to_square is None:
+            return MOVES_BY_INT[MOVE_INT_NULL]
+        return cls(from_square, to_square, promotion, drop_piece_type)
+
     @classmethod
     def null(cls):
         '''
@@ -119,4 +237,58 @@ class Move(object):
         >>> bool(shogi.Move.null())
         False
         '''
-        return cls(None, None, NONE)
+        return MOVES_BY_INT[MOVE_INT_NULL]
+
+class MappingProxy(Mapping):
+    '''
+    A read-only view of a dictionary, like `types.MappingProxyType` which
+    Python 2 does not have.
+    '''
+
+    __slots__ = ('mapping', )
+
+    def __init__(self, mapping):
+        object.__setattr__(self, 'mapping', mapping)
+
+    def __getitem__(self, key):
+        return self.mapping[key]
+
+    def get(self, key, default=None):
+        return self.mapping.get(key, default)
+
+    def __contains__(self, key):
+        return key in self.mapping
+
+    def __iter__(self):
+        return iter(self.mapping)
+
+    def __len__(self):
+        return len(self.mapping)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('MappingProxy is read-only')
+
+try:
+    from types import MappingProxyType
+except ImportError:
+    MappingProxyType = MappingProxy
+
+# Registry of shared moves: every move between two different squares, with
+# and without promotion, every drop of a piece in hand and the null move.
+# Generators and parsers hand out these instances.
+MOVES_BY_INT = [None for i in range(1 << 15)]
+MOVES_BY_USI = {}
+
+for move in ([Move(from_square, to_square, promotion)
+              for from_square in range(len(SQUARE_NAMES))
+              for to_square in range(len(SQUARE_NAMES)) if from_square != to_square
+              for promotion in (False, True)] +
+             [Move(None, to_square, False, piece_type)
+              for piece_type in range(PAWN, KING)
+              for to_square in range(len(SQUARE_NAMES))] +
+             [Move(None, None, False)]):
+    MOVES_BY_INT[move.to_int()] = move
+    MOVES_BY_USI[move.usi()] = move
+
+MOVES_BY_INT = tuple(MOVES_BY_INT)
+MOVES_BY_USI = MappingProxyType(MOVES_BY_USI)
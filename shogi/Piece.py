@@ -12,7 +12,12 @@ PIECE_JAPANESE_SYMBOLS = [
     '玉', 'と', '杏', '圭', '全', '馬', '龍', '酔', '太'
 ]
 
+# Piece types by symbol, without the empty symbol of NONE.
+PIECE_SYMBOL_INDEXES = dict((symbol, piece_type) for piece_type, symbol in enumerate(PIECE_SYMBOLS) if symbol)
+
 class Piece(object):
+    __slots__ = ('piece_type', 'color')
+
     def __init__(self, piece_type, color):
         if piece_type is None:
             raise ValueError('Piece type must be set')
@@ -62,13 +67,24 @@ class Piece(object):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    @classmethod
+    def get(cls, piece_type, color):
+        '''
+        Gets the shared piece instance for a piece type and a color.
+        '''
+        return PIECES[color][piece_type]
+
     @classmethod
     def from_symbol(cls, symbol):
         '''
-        Creates a piece instance from a piece symbol.
+        Gets the piece instance for a piece symbol.
         Raises `ValueError` if the symbol is invalid.
         '''
-        if symbol.lower() == symbol:
-            return cls(PIECE_SYMBOLS.index(symbol), WHITE)
-        else:
-            return cls(PIECE_SYMBOLS.index(symbol.lower()), BLACK)
+        lower = symbol.lower()
+        if lower not in PIECE_SYMBOL_INDEXES:
+            raise ValueError('Invalid piece symbol: {0}'.format(repr(symbol)))
+        return PIECES[WHITE if lower == symbol else BLACK][PIECE_SYMBOL_INDEXES[lower]]
+
+# Shared pieces indexed by color and piece type. Board hands out these
+# instances, so treat them as read-only.
+PIECES = [[None] + [Piece(piece_type, color) for piece_type in PIECE_TYPES] for color in COLORS]
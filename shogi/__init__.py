@@ -23,8 +23,15 @@ __author__ = 'Tasuku SUENAGA a.k.a. gunyarakun'
 __email__ = 'tasuku-s-github@titech.ac'
 __version__ = '1.0.16'
 
+import numbers
+import warnings
 import collections
 
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
+
 from .Move import *
 from .Piece import *
 from .Consts import *
@@ -56,6 +63,56 @@ PIECE_PROMOTED = [
            None,       None,    PROM_SUI,        None,
 ]
 
+# Captured pieces of these types do not go into the hand.
+PIECE_TYPES_NOT_IN_HAND = frozenset([KING, SUI, PROM_SUI])
+
+# Kings and sui (which may promote to one more king) can answer a check
+# from anywhere.
+ROYAL_OR_SUI_PIECE_TYPES = frozenset([KING, SUI, PROM_SUI])
+
+PIECE_UNPROMOTED = [piece_type if piece_type not in PIECE_PROMOTED else PIECE_PROMOTED.index(piece_type)
+                    for piece_type in PIECE_TYPES_WITH_NONE]
+
+# Pieces in hand are packed into one integer per side: a 5 bit count for
+# each piece type from PAWN to ROOK, each followed by a guard bit which
+# catches borrows when hands are compared.
+HAND_PIECE_TYPES = [PAWN, LANCE, KNIGHT, SILVER, GOLD, BISHOP, ROOK]
+HAND_BITS = 6
+HAND_COUNT_MAX = 31
+HAND_SHIFTS = [(piece_type - 1) * HAND_BITS if piece_type in HAND_PIECE_TYPES else None
+               for piece_type in PIECE_TYPES_WITH_NONE]
+HAND_GUARDS = 0
+for piece_type in HAND_PIECE_TYPES:
+    HAND_GUARDS |= (HAND_COUNT_MAX + 1) << HAND_SHIFTS[piece_type]
+
+def pack_hand(counts):
+    '''
+    Packs a mapping of piece types to counts into a hand integer.
+    Raises `ValueError` for pieces which can not be in hand.
+    '''
+    hand = 0
+    for piece_type, count in counts.items():
+        if not count:
+            continue
+        if piece_type not in HAND_PIECE_TYPES or not 0 < count <= HAND_COUNT_MAX:
+            raise ValueError('Can not have {0} of piece type {1} in hand'.format(count, piece_type))
+        hand |= count << HAND_SHIFTS[piece_type]
+    return hand
+
+def hand_count(hand, piece_type):
+    '''Gets the number of pieces of a type in a hand integer.'''
+    shift = HAND_SHIFTS[piece_type]
+    if shift is None:
+        return 0
+    return (hand >> shift) & HAND_COUNT_MAX
+
+def hand_is_superior(hand, other):
+    '''
+    Checks if a hand integer has at least as many pieces of every type as
+    the other one.
+    '''
+    return ((hand | HAND_GUARDS) - other) & HAND_GUARDS == HAND_GUARDS
+
 NUMBER_JAPANESE_NUMBER_SYMBOLS = [
     '０', '１', '２', '３', '４',
     '５', '６', '７', '８', '９'
@@ -69,6 +126,13 @@ NUMBER_JAPANESE_KANJI_SYMBOLS = [
 
 STARTING_SFEN = 'lnsgkgsnl/1r2z2b1/ppppppppp/9/9/9/PPPPPPPPP/1B2Z2R1/LNSGKGSNL b - 1'
 
+# Kinds of repetition (sennichite) from the view of the side to move, see
+# `Board.repetition()`.
+REPETITIONS = [
+    REPETITION_NONE, REPETITION_DRAW, REPETITION_WIN, REPETITION_LOSE,
+    REPETITION_SUPERIOR, REPETITION_INFERIOR,
+] = range(6)
+
 SQUARES = [
     A9, A8, A7, A6, A5, A4, A3, A2, A1,
     B9, B8, B7, B6, B5, B4, B3, B2, B1,
@@ -439,6 +503,237 @@ for s in SQUARES:
 
         BB_R45_ATTACKS[s][b] = mask
 
+# Rays in each direction, not including the square itself.
+BB_RAYS_UP = []
+BB_RAYS_DOWN = []
+BB_RAYS_LEFT = []
+BB_RAYS_RIGHT = []
+BB_RAYS_UP_LEFT = []
+BB_RAYS_UP_RIGHT = []
+BB_RAYS_DOWN_LEFT = []
+BB_RAYS_DOWN_RIGHT = []
+
+for rays, shift in [(BB_RAYS_UP, shift_up), (BB_RAYS_DOWN, shift_down),
+                    (BB_RAYS_LEFT, shift_left), (BB_RAYS_RIGHT, shift_right),
+                    (BB_RAYS_UP_LEFT, shift_up_left), (BB_RAYS_UP_RIGHT, shift_up_right),
+                    (BB_RAYS_DOWN_LEFT, shift_down_left), (BB_RAYS_DOWN_RIGHT, shift_down_right)]:
+    for bb_square in BB_SQUARES:
+        mask = BB_VOID
+        bb_square = shift(bb_square) & BB_ALL
+        while bb_square:
+            mask |= bb_square
+            bb_square = shift(bb_square) & BB_ALL
+        rays.append(mask)
+
+# Squares strictly between two aligned squares and the whole line through
+# them, indexed by square_a * 81 + square_b. Empty if they are not aligned.
+BB_BETWEEN = [BB_VOID for i in range(81 * 81)]
+BB_LINES = [BB_VOID for i in range(81 * 81)]
+
+for rays, opposite_rays in [(BB_RAYS_UP, BB_RAYS_DOWN), (BB_RAYS_DOWN, BB_RAYS_UP),
+                            (BB_RAYS_LEFT, BB_RAYS_RIGHT), (BB_RAYS_RIGHT, BB_RAYS_LEFT),
+                            (BB_RAYS_UP_LEFT, BB_RAYS_DOWN_RIGHT), (BB_RAYS_DOWN_RIGHT, BB_RAYS_UP_LEFT),
+                            (BB_RAYS_UP_RIGHT, BB_RAYS_DOWN_LEFT), (BB_RAYS_DOWN_LEFT, BB_RAYS_UP_RIGHT)]:
+    for square_a in SQUARES:
+        line = rays[square_a] | opposite_rays[square_a] | BB_SQUARES[square_a]
+        for square_b in SQUARES:
+            if rays[square_a] & BB_SQUARES[square_b]:
+                BB_BETWEEN[square_a * 81 + square_b] = rays[square_a] & opposite_rays[square_b]
+                BB_LINES[square_a * 81 + square_b] = line
+
+def forward_ray_attacks(rays, square, bits):
+    # The ray points to higher square indices, so the nearest blocker is the
+    # lowest bit: o ^ (o - 2r) sets every square up to and including it.
+    ray = rays[square]
+    o = bits & ray
+    return (o ^ (o - (BB_SQUARES[square] << 1))) & ray
+
+def backward_ray_attacks(rays, square, bits):
+    # The ray points to lower square indices, so the nearest blocker is the
+    # highest bit.
+    ray = rays[square]
+    o = bits & ray
+    if o:
+        return ray ^ rays[o.bit_length() - 1]
+    return ray
+
+def file_attacks(square, bits):
+    return (forward_ray_attacks(BB_RAYS_DOWN, square, bits) |
+            backward_ray_attacks(BB_RAYS_UP, square, bits))
+
+def rank_attacks(square, bits):
+    return (forward_ray_attacks(BB_RAYS_RIGHT, square, bits) |
+            backward_ray_attacks(BB_RAYS_LEFT, square, bits))
+
+def l45_attacks(square, bits):
+    return (forward_ray_attacks(BB_RAYS_DOWN_LEFT, square, bits) |
+            backward_ray_attacks(BB_RAYS_UP_RIGHT, square, bits))
+
+def r45_attacks(square, bits):
+    return (forward_ray_attacks(BB_RAYS_DOWN_RIGHT, square, bits) |
+            backward_ray_attacks(BB_RAYS_UP_LEFT, square, bits))
+
+# Occupancy masks of the squares that can block a slider. The last square of
+# a ray never blocks anything, so it is left out to keep the tables small.
+BB_FILE_MASKS = [(BB_RAYS_UP[s] | BB_RAYS_DOWN[s]) & ~(BB_RANK_A | BB_RANK_I) for s in SQUARES]
+BB_RANK_MASKS = [(BB_RAYS_LEFT[s] | BB_RAYS_RIGHT[s]) & ~(BB_FILE_9 | BB_FILE_1) for s in SQUARES]
+BB_L45_MASKS = [(BB_RAYS_UP_RIGHT[s] | BB_RAYS_DOWN_LEFT[s]) &
+                ~(BB_RANK_A | BB_RANK_I | BB_FILE_9 | BB_FILE_1) for s in SQUARES]
+BB_R45_MASKS = [(BB_RAYS_UP_LEFT[s] | BB_RAYS_DOWN_RIGHT[s]) &
+                ~(BB_RANK_A | BB_RANK_I | BB_FILE_9 | BB_FILE_1) for s in SQUARES]
+BB_LANCE_MASKS = [
+    [BB_RAYS_UP[s] & ~BB_RANK_A for s in SQUARES],
+    [BB_RAYS_DOWN[s] & ~BB_RANK_I for s in SQUARES],
+]
+
+# Attacks looked up by the masked occupancy itself. The dict hash plays the
+# role of the magic multiplication in a magic bitboard implementation.
+BB_FILE_DIRECT_ATTACKS = [{} for s in SQUARES]
+BB_RANK_DIRECT_ATTACKS = [{} for s in SQUARES]
+BB_L45_DIRECT_ATTACKS = [{} for s in SQUARES]
+BB_R45_DIRECT_ATTACKS = [{} for s in SQUARES]
+BB_LANCE_DIRECT_ATTACKS = [
+    [{} for s in SQUARES],
+    [{} for s in SQUARES],
+]
+
+for table, masks, attacks in [
+        (BB_FILE_DIRECT_ATTACKS, BB_FILE_MASKS, file_attacks),
+        (BB_RANK_DIRECT_ATTACKS, BB_RANK_MASKS, rank_attacks),
+        (BB_L45_DIRECT_ATTACKS, BB_L45_MASKS, l45_attacks),
+        (BB_R45_DIRECT_ATTACKS, BB_R45_MASKS, r45_attacks),
+        (BB_LANCE_DIRECT_ATTACKS[BLACK], BB_LANCE_MASKS[BLACK],
+            lambda s, b: backward_ray_attacks(BB_RAYS_UP, s, b)),
+        (BB_LANCE_DIRECT_ATTACKS[WHITE], BB_LANCE_MASKS[WHITE],
+            lambda s, b: forward_ray_attacks(BB_RAYS_DOWN, s, b))]:
+    for s in SQUARES:
+        mask = masks[s]
+        # Enumerate all subsets of the mask (Carry-Rippler).
+        b = BB_VOID
+        while True:
+            table[s][b] = attacks(s, b)
+            b = (b - mask) & mask
+            if not b:
+                break
+
+# Sliding attack backends. All of them take the square, an `Occupied` and the
+# color of the moving piece (only meaningful for lances).
+
+def rotated_lance_attacks(square, occupied, color):
+    return BB_LANCE_ATTACKS[color][square][(occupied.l90 >> (((square % 9) * 9) + 1)) & 127]
+
+def rotated_bishop_attacks(square, occupied, color=BLACK):
+    return (BB_R45_ATTACKS[square][(occupied.r45 >> BB_SHIFT_R45[square]) & 127] |
+            BB_L45_ATTACKS[square][(occupied.l45 >> BB_SHIFT_L45[square]) & 127])
+
+def rotated_rook_attacks(square, occupied, color=BLACK):
+    return (BB_RANK_ATTACKS[square][(occupied.bits >> (((square // 9) * 9) + 1)) & 127] |
+            BB_FILE_ATTACKS[square][(occupied.l90 >> (((square % 9) * 9) + 1)) & 127])
+
+def subtraction_lance_attacks(square, occupied, color):
+    if color == BLACK:
+        return backward_ray_attacks(BB_RAYS_UP, square, occupied.bits)
+    else:
+        return forward_ray_attacks(BB_RAYS_DOWN, square, occupied.bits)
+
+def subtraction_bishop_attacks(square, occupied, color=BLACK):
+    bits = occupied.bits
+    return l45_attacks(square, bits) | r45_attacks(square, bits)
+
+def subtraction_rook_attacks(square, occupied, color=BLACK):
+    bits = occupied.bits
+    return file_attacks(square, bits) | rank_attacks(square, bits)
+
+def direct_lance_attacks(square, occupied, color):
+    return BB_LANCE_DIRECT_ATTACKS[color][square][occupied.bits & BB_LANCE_MASKS[color][square]]
+
+def direct_bishop_attacks(square, occupied, color=BLACK):
+    bits = occupied.bits
+    return (BB_L45_DIRECT_ATTACKS[square][bits & BB_L45_MASKS[square]] |
+            BB_R45_DIRECT_ATTACKS[square][bits & BB_R45_MASKS[square]])
+
+def direct_rook_attacks(square, occupied, color=BLACK):
+    bits = occupied.bits
+    return (BB_FILE_DIRECT_ATTACKS[square][bits & BB_FILE_MASKS[square]] |
+            BB_RANK_DIRECT_ATTACKS[square][bits & BB_RANK_MASKS[square]])
+
+SlidingBackend = collections.namedtuple('SlidingBackend', ['name', 'rotated', 'lance', 'bishop', 'rook'])
+
+SLIDING_BACKENDS = collections.OrderedDict([
+    ('rotated', SlidingBackend('rotated', True,
+        rotated_lance_attacks, rotated_bishop_attacks, rotated_rook_attacks)),
+    ('subtraction', SlidingBackend('subtraction', False,
+        subtraction_lance_attacks, subtraction_bishop_attacks, subtraction_rook_attacks)),
+    ('direct', SlidingBackend('direct', False,
+        direct_lance_attacks, direct_bishop_attacks, direct_rook_attacks)),
+])
+
+# Attacks of the non-sliding part of every piece, indexed by
+# (piece_type * 2 + color) * 81 + square.
+BB_STEP_ATTACKS = [BB_VOID for i in range(len(PIECE_TYPES_WITH_NONE) * 2 * 81)]
+
+for piece_type, tables in [
+        (PAWN, BB_PAWN_ATTACKS),
+        (KNIGHT, BB_KNIGHT_ATTACKS),
+        (SILVER, BB_SILVER_ATTACKS),
+        (GOLD, BB_GOLD_ATTACKS),
+        (PROM_PAWN, BB_GOLD_ATTACKS),
+        (PROM_LANCE, BB_GOLD_ATTACKS),
+        (PROM_KNIGHT, BB_GOLD_ATTACKS),
+        (PROM_SILVER, BB_GOLD_ATTACKS),
+        (KING, [BB_KING_ATTACKS, BB_KING_ATTACKS]),
+        (PROM_BISHOP, [BB_KING_ATTACKS, BB_KING_ATTACKS]),
+        (PROM_ROOK, [BB_KING_ATTACKS, BB_KING_ATTACKS]),
+        (SUI, BB_SUI_ATTACKS),
+        (PROM_SUI, [BB_KING_ATTACKS, BB_KING_ATTACKS])]:
+    for color in COLORS:
+        for square in SQUARES:
+            BB_STEP_ATTACKS[(piece_type * 2 + color) * 81 + square] = tables[color][square]
+
+# Sliding part of every piece as a callable(square, occupied, color), or None.
+# Kept in sync with the active backend by set_sliding_backend().
+PIECE_SLIDING_ATTACKS = [None for piece_type in PIECE_TYPES_WITH_NONE]
+
+def update_piece_sliding_attacks():
+    PIECE_SLIDING_ATTACKS[LANCE] = lance_attacks
+    PIECE_SLIDING_ATTACKS[BISHOP] = bishop_attacks
+    PIECE_SLIDING_ATTACKS[PROM_BISHOP] = bishop_attacks
+    PIECE_SLIDING_ATTACKS[ROOK] = rook_attacks
+    PIECE_SLIDING_ATTACKS[PROM_ROOK] = rook_attacks
+
+sliding_backend = SLIDING_BACKENDS['direct']
+lance_attacks = sliding_backend.lance
+bishop_attacks = sliding_backend.bishop
+rook_attacks = sliding_backend.rook
+update_piece_sliding_attacks()
+
+def set_sliding_backend(name):
+    '''
+    Selects how lance, bishop and rook attacks are computed: `rotated`
+    (rotated bitboards), `subtraction` (o ^ (o - 2r) on rays) or `direct`
+    (lookup by masked occupancy).
+    Returns the previously active backend name.
+    '''
+    global sliding_backend, lance_attacks, bishop_attacks, rook_attacks
+
+    if name not in SLIDING_BACKENDS:
+        raise ValueError('Unknown sliding backend: {0}'.format(repr(name)))
+
+    previous = sliding_backend.name
+    sliding_backend = SLIDING_BACKENDS[name]
+    lance_attacks = sliding_backend.lance
+    bishop_attacks = sliding_backend.bishop
+    rook_attacks = sliding_backend.rook
+    update_piece_sliding_attacks()
+    return previous
+
+SLIDING_BENCHMARK_SFENS = [
+    STARTING_SFEN,
+    'ln1g3+Rl/1ks4s1/pp1gppbpp/2p3N2/9/5P1P1/PPPP1S1bP/2K1R1G2/LNSG3NL w 4p 42',
+    'lnsg1g1nl/3k3r1/pppp1s1pp/b3p1p2/2PP1p2B/P3P3P/1P3PPP1/1S3K1R1/LN1G1GSNL w - 1',
+    'l6nl/5+P1gk/2np1S3/p1p4Pp/3P2Sp1/1PPb2P1P/P5GS1/R8/LN4bKL w RGgsn5p 1',
+]
+
 try:
     from gmpy2 import popcount as pop_count
     from gmpy2 import bit_scan1 as bit_scan
@@ -479,22 +774,48 @@ def can_move_without_promotion(to_square, piece_type, color):
                 (piece_type == LANCE and rank_index(to_square) < 8) or
                 (piece_type == KNIGHT and rank_index(to_square) < 7) )
 
+BB_PROMOTION_ZONES = [
+    BB_RANK_A | BB_RANK_B | BB_RANK_C,
+    BB_RANK_G | BB_RANK_H | BB_RANK_I,
+]
+
+# Squares a piece cannot move or be dropped to without promotion.
+BB_DEAD_SQUARES = [[BB_VOID for piece_type in PIECE_TYPES_WITH_NONE] for color in COLORS]
+BB_DEAD_SQUARES[BLACK][PAWN] = BB_RANK_A
+BB_DEAD_SQUARES[BLACK][LANCE] = BB_RANK_A
+BB_DEAD_SQUARES[BLACK][KNIGHT] = BB_RANK_A | BB_RANK_B
+BB_DEAD_SQUARES[WHITE][PAWN] = BB_RANK_I
+BB_DEAD_SQUARES[WHITE][LANCE] = BB_RANK_I
+BB_DEAD_SQUARES[WHITE][KNIGHT] = BB_RANK_H | BB_RANK_I
+
 
 class Occupied(object):
     def __init__(self, occupied_by_black, occupied_by_white):
         self.by_color = [occupied_by_black, occupied_by_white]
         self.bits = occupied_by_black | occupied_by_white
-        self.l45 = BB_VOID
-        self.r45 = BB_VOID
-        self.l90 = BB_VOID
-        self.update_rotated()
+        # Rotated bitboards are only kept up to date for backends using them.
+        self.rotated = sliding_backend.rotated
+        if self.rotated:
+            self.update_rotated()
 
     def update_rotated(self):
+        self.l90 = BB_VOID
+        self.r45 = BB_VOID
+        self.l45 = BB_VOID
         for i in SQUARES:
             if BB_SQUARES[i] & self.bits:
                 self.l90 |= BB_SQUARES_L90[i]
                 self.r45 |= BB_SQUARES_R45[i]
                 self.l45 |= BB_SQUARES_L45[i]
+        self.rotated = True
+
+    def __getattr__(self, name):
+        # Only called for missing attributes: build the rotated bitboards on
+        # first use, e.g. after switching to the rotated backend.
+        if name in ('l90', 'r45', 'l45'):
+            self.update_rotated()
+            return self.__dict__[name]
+        raise AttributeError(name)
 
     def __getitem__(self, key):
         if key in COLORS:
@@ -504,13 +825,20 @@ class Occupied(object):
     def ixor(self, mask, color, square):
         self.bits ^= mask
         self.by_color[color] ^= mask
-        self.l90 ^= BB_SQUARES[SQUARES_L90[square]]
-        self.r45 ^= BB_SQUARES[SQUARES_R45[square]]
-        self.l45 ^= BB_SQUARES[SQUARES_L45[square]]
+        if self.rotated:
+            self.l90 ^= BB_SQUARES_L90[square]
+            self.r45 ^= BB_SQUARES_R45[square]
+            self.l45 ^= BB_SQUARES_L45[square]
 
     def non_occupied(self):
         return ~self.bits & BB_ALL
 
+    def copy(self):
+        occupied = Occupied.__new__(Occupied)
+        occupied.__dict__.update(self.__dict__)
+        occupied.by_color = self.by_color[:]
+        return occupied
+
     def __eq__(self, occupied):
         return not self.__ne__(occupied)
 
@@ -524,6 +852,312 @@ class Occupied(object):
     def __repr__(self):
         return 'Occupied({0})'.format(repr(self.by_color))
 
+# Used to look up sliding attacks on an empty board.
+OCCUPIED_EMPTY = Occupied(BB_VOID, BB_VOID)
+
+
+class PiecesInHand(Mapping):
+    '''
+    A read-only view of the packed hand of one side, which can be used like
+    a `collections.Counter` of piece types. Comparing with `<=` and `>=`
+    tells if a hand has at most or at least as many pieces of every type.
+    '''
+
+    def __init__(self, board, color):
+        self.board = board
+        self.color = color
+
+    @property
+    def packed(self):
+        return self.board.hands[self.color]
+
+    def __getitem__(self, piece_type):
+        return hand_count(self.board.hands[self.color], piece_type)
+
+    def __contains__(self, piece_type):
+        return hand_count(self.board.hands[self.color], piece_type) > 0
+
+    def __iter__(self):
+        hand = self.board.hands[self.color]
+        return (piece_type for piece_type in HAND_PIECE_TYPES if hand_count(hand, piece_type))
+
+    def __len__(self):
+        hand = self.board.hands[self.color]
+        return sum(1 for piece_type in HAND_PIECE_TYPES if hand_count(hand, piece_type))
+
+    def elements(self):
+        for piece_type, count in self.items():
+            for i in range(count):
+                yield piece_type
+
+    @staticmethod
+    def packed_hand(other):
+        if isinstance(other, PiecesInHand):
+            return other.packed
+        return pack_hand(other)
+
+    def __eq__(self, other):
+        try:
+            return self.packed == PiecesInHand.packed_hand(other)
+        except (AttributeError, ValueError):
+            return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __ge__(self, other):
+        return hand_is_superior(self.packed, PiecesInHand.packed_hand(other))
+
+    def __le__(self, other):
+        return hand_is_superior(PiecesInHand.packed_hand(other), self.packed)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'PiecesInHand({0})'.format(dict(self.items()))
+
+
+class StateInfo(object):
+    '''
+    What `Board.push_int()` records for each ply so that `Board.pop()` can
+    restore the previous position by assignment: the move, the captured
+    piece type, the hand of the moving side and the hashes before the move.
+    '''
+
+    __slots__ = ('move', 'move_int', 'captured_piece_type', 'hand',
+                 'zobrist_key', 'incremental_zobrist_hash', 'zobrist_key_high')
+
+    def __init__(self, move, move_int, captured_piece_type, hand,
+                 zobrist_key, incremental_zobrist_hash, zobrist_key_high):
+        self.move = move
+        self.move_int = move_int
+        self.captured_piece_type = captured_piece_type
+        self.hand = hand
+        self.zobrist_key = zobrist_key
+        self.incremental_zobrist_hash = incremental_zobrist_hash
+        self.zobrist_key_high = zobrist_key_high
+
+    def __repr__(self):
+        return 'StateInfo({0}, captured_piece_type={1})'.format(repr(self.move), self.captured_piece_type)
+
+class StateStack(Sequence):
+    '''
+    A read-only view of one field of the state records of a board, like
+    `Board.move_stack` for the moves.
+    '''
+
+    def __init__(self, board, field):
+        self.board = board
+        self.field = field
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [getattr(state, self.field) for state in self.board.states[index]]
+        return getattr(self.board.states[index], self.field)
+
+    def __len__(self):
+        return len(self.board.states)
+
+    def __iter__(self):
+        field = self.field
+        return (getattr(state, field) for state in self.board.states)
+
+    def __reversed__(self):
+        field = self.field
+        return (getattr(state, field) for state in reversed(self.board.states))
+
+    def __eq__(self, other):
+        if not isinstance(other, (Sequence, collections.deque)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'StateStack({0})'.format(list(self))
+
+# Piece types and colors by SFEN letter.
+SFEN_PIECES = dict(
+    [(PIECE_SYMBOLS[piece_type], (piece_type, WHITE)) for piece_type in PIECE_TYPES if len(PIECE_SYMBOLS[piece_type]) == 1] +
+    [(PIECE_SYMBOLS[piece_type].upper(), (piece_type, BLACK)) for piece_type in PIECE_TYPES if len(PIECE_SYMBOLS[piece_type]) == 1])
+
+SFEN_DIGITS = dict((str(i), i) for i in range(10))
+
+# SFEN letters by color and piece type.
+SFEN_SYMBOLS = [[piece.symbol() if piece else '' for piece in PIECES[color]] for color in COLORS]
+
+# Number of positions `Board.sfen()` remembers per board.
+SFEN_MEMO_SIZE = 1024
+
+# Number of decoded SFENs kept by `decode_sfen()`, see `set_sfen_cache_size()`.
+SFEN_CACHE_SIZE = 1024
+sfen_cache = collections.OrderedDict()
+
+def set_sfen_cache_size(size):
+    '''
+    Sets how many decoded SFENs `decode_sfen()` keeps, dropping the least
+    recently used ones first. 0 disables the cache.
+    Returns the previous size.
+    '''
+    global SFEN_CACHE_SIZE
+
+    previous = SFEN_CACHE_SIZE
+    SFEN_CACHE_SIZE = size
+    while len(sfen_cache) > max(size, 0):
+        sfen_cache.popitem(last=False)
+    return previous
+
+def decode_sfen(sfen, validate=True):
+    '''
+    Decodes a SFEN in a single pass into a tuple of bitboards, mailbox,
+    occupancy, hands, royal piece bookkeeping, turn, move number and
+    Zobrist keys, as loaded by `Board.set_sfen()`. The tuple must not be
+    changed, it is shared through the cache of recently decoded SFENs.
+    Raises `ValueError` if the SFEN string is invalid. With
+    `validate=False` the SFEN is trusted to be well formed and only
+    unknown characters are rejected.
+    '''
+    if SFEN_CACHE_SIZE > 0:
+        entry = sfen_cache.pop(sfen, None)
+        if entry is None or (validate and not entry[0]):
+            entry = (validate, decode_sfen_uncached(sfen, validate))
+        sfen_cache[sfen] = entry
+        if len(sfen_cache) > SFEN_CACHE_SIZE:
+            sfen_cache.popitem(last=False)
+        return entry[1]
+    return decode_sfen_uncached(sfen, validate)
+
+def decode_sfen_uncached(sfen, validate=True):
+    # Ensure there are six parts.
+    parts = sfen.split()
+    if len(parts) != 4:
+        raise ValueError('sfen string should consist of 6 parts: {0}'.format(repr(sfen)))
+
+    piece_bb = [BB_VOID for piece_type in PIECE_TYPES_WITH_NONE]
+    pieces = [NONE for square in SQUARES]
+    occupied_by_color = [BB_VOID, BB_VOID]
+    king_squares = [None, None]
+    promsui_squares = [None, None]
+    kings_living = [0, 0]
+    zobrist_hash = 0
+
+    # Put pieces on the board, validating the rows on the way.
+    square = 0
+    row_end = 9
+    rows = 1
+    promoted = False
+    previous_was_digit = False
+    for c in parts[0]:
+        piece = SFEN_PIECES.get(c)
+        if piece is not None:
+            piece_type, color = piece
+            if promoted:
+                piece_type = PIECE_PROMOTED[piece_type]
+                if piece_type is None:
+                    raise ValueError('Gold and King cannot promote in position part of sfen: {0}'.format(repr(sfen)))
+                promoted = False
+            if square >= row_end:
+                raise ValueError('expected 9 columns per row in position part of sfen: {0}'.format(repr(sfen)))
+
+            mask = BB_SQUARES[square]
+            piece_bb[piece_type] |= mask
+            pieces[square] = piece_type
+            occupied_by_color[color] |= mask
+            if piece_type == KING:
+                king_squares[color] = square
+                kings_living[color] += 1
+            elif piece_type == PROM_SUI:
+                promsui_squares[color] = square
+                kings_living[color] += 1
+            zobrist_hash ^= DEFAULT_RANDOM_ARRAY[81 * ((piece_type - 1) * 2 + color) + square]
+            square += 1
+            previous_was_digit = False
+        elif c in SFEN_DIGITS and c != '0':
+            if validate:
+                if previous_was_digit:
+                    raise ValueError('two subsequent digits in position part of sfen: {0}'.format(repr(sfen)))
+                if promoted:
+                    raise ValueError('Cannot promote squares in position part of sfen: {0}'.format(repr(sfen)))
+            square += SFEN_DIGITS[c]
+            previous_was_digit = True
+        elif c == '+':
+            if validate and promoted:
+                raise ValueError('Double promotion prefixes in position part of sfen: {0}'.format(repr(sfen)))
+            promoted = True
+            previous_was_digit = False
+        elif c == '/':
+            if validate:
+                if square != row_end:
+                    raise ValueError('expected 9 columns per row in position part of sfen: {0}'.format(repr(sfen)))
+                if promoted:
+                    raise ValueError('Cannot promote squares in position part of sfen: {0}'.format(repr(sfen)))
+            rows += 1
+            if rows > 9:
+                raise ValueError('expected 9 rows in position part of sfen: {0}'.format(repr(sfen)))
+            square = row_end
+            row_end += 9
+            previous_was_digit = False
+        else:
+            raise ValueError('invalid character in position part of sfen: {0}'.format(repr(sfen)))
+
+    if validate:
+        if rows != 9:
+            raise ValueError('expected 9 rows in position part of sfen: {0}'.format(repr(sfen)))
+        if square != row_end or promoted:
+            raise ValueError('expected 9 columns per row in position part of sfen: {0}'.format(repr(sfen)))
+
+    # Check that the turn part is valid.
+    if parts[1] == 'w':
+        turn = WHITE
+        zobrist_key = zobrist_hash ^ ZOBRIST_TURN_KEY
+    elif parts[1] == 'b' or not validate:
+        turn = BLACK
+        zobrist_key = zobrist_hash
+    else:
+        raise ValueError("expected 'b' or 'w' for turn part of sfen: {0}".format(repr(sfen)))
+
+    # Set the pieces in hand.
+    hands = [0, 0]
+    if parts[2] != '-':
+        piece_count = 0
+        for c in parts[2]:
+            if c in SFEN_DIGITS:
+                piece_count = piece_count * 10 + SFEN_DIGITS[c]
+                continue
+
+            piece = SFEN_PIECES.get(c)
+            if piece is None:
+                raise ValueError('invalid character in pieces in hand part of sfen: {0}'.format(repr(sfen)))
+            piece_type, color = piece
+            if piece_type not in PIECE_TYPES_NOT_IN_HAND:
+                # Larger counts would carry past the guard bit.
+                if piece_count > HAND_COUNT_MAX:
+                    raise ValueError('Too many pieces in hand: {0}'.format(repr(sfen)))
+                shift = HAND_SHIFTS[piece_type]
+                hands[color] += (piece_count or 1) << shift
+                if hands[color] & HAND_GUARDS:
+                    raise ValueError('Too many pieces in hand: {0}'.format(repr(sfen)))
+            piece_count = 0
+
+        for color in COLORS:
+            hand = hands[color]
+            for piece_type in HAND_PIECE_TYPES:
+                zobrist_key ^= ZOBRIST_HAND_KEYS[(color * 8 + piece_type) * (HAND_COUNT_MAX + 1) +
+                                                 ((hand >> HAND_SHIFTS[piece_type]) & HAND_COUNT_MAX)]
+
+    # Check that the fullmove number part is valid.
+    # 0 is allowed for compability but later replaced with 1.
+    move_number = int(parts[3])
+    if move_number < 0:
+        raise ValueError('fullmove number must be positive: {0}'.format(repr(sfen)))
+
+    return (tuple(piece_bb), tuple(pieces), Occupied(occupied_by_color[BLACK], occupied_by_color[WHITE]),
+            tuple(hands), tuple(king_squares), tuple(promsui_squares), tuple(kings_living), turn,
+            move_number or 1, zobrist_hash, zobrist_key)
 
 class Board(object):
     '''
@@ -533,60 +1167,38 @@ class Board(object):
     moves.
     The bitboard is initialized to the starting position, unless otherwise
     specified in the optional `sfen` argument.
+    Setting `check_zobrist` (on a board or on the class) makes every
+    `zobrist_hash()` call verify the incremental key, for debugging.
+    With `track_attacks` the squares attacked by each side are kept up to
+    date while pieces are set and removed, see `enable_attack_maps()`.
+    With `wide_zobrist` a second, independent 64 bit Zobrist key is kept
+    as well, see `zobrist_hash128()`.
     '''
 
-    def __init__(self, sfen=None):
-        self.pseudo_legal_moves = PseudoLegalMoveGenerator(self)
-        self.legal_moves = LegalMoveGenerator(self)
+    check_zobrist = False
+
+    def __init__(self, sfen=None, track_attacks=False, wide_zobrist=False):
+        self.init_views()
+        self.track_attacks = track_attacks
+        self.attack_maps = None
+        self.zobrist_key_high = 0 if wide_zobrist else None
 
         if sfen is None:
             self.reset()
         else:
             self.set_sfen(sfen)
 
+    def init_views(self):
+        self.pseudo_legal_moves = PseudoLegalMoveGenerator(self)
+        self.legal_moves = LegalMoveGenerator(self)
+        self.pieces_in_hand = [PiecesInHand(self, BLACK), PiecesInHand(self, WHITE)]
+        self.move_stack = StateStack(self, 'move')
+        self.captured_piece_stack = StateStack(self, 'captured_piece_type')
+        self.sfen_memo = {}
+
     def reset(self):
         '''Restores the starting position.'''
-        self.piece_bb = [
-                BB_VOID,                       # NONE
-                BB_RANK_C | BB_RANK_G,         # PAWN
-                BB_A1 | BB_I1 | BB_A9 | BB_I9, # LANCE
-                BB_A2 | BB_A8 | BB_I2 | BB_I8, # KNIGHT
-                BB_A3 | BB_A7 | BB_I3 | BB_I7, # SILVER
-                BB_A4 | BB_A6 | BB_I4 | BB_I6, # GOLD
-                BB_B2 | BB_H8,                 # BISHOP
-                BB_B8 | BB_H2,                 # ROOK
-                BB_A5 | BB_I5,                 # KING
-                BB_VOID,                       # PROM_PAWN
-                BB_VOID,                       # PROM_LANCE
-                BB_VOID,                       # PROM_KNIGHT
-                BB_VOID,                       # PROM_SILVER
-                BB_VOID,                       # PROM_BISHOP
-                BB_VOID,                       # PROM_ROOK
-                BB_B5 | BB_H5,                 # SUI
-                BB_VOID,                       # PROM_SUI
-        ]
-
-        self.pieces_in_hand = [collections.Counter(), collections.Counter()]
-
-        self.occupied = Occupied(BB_RANK_G | BB_H2 | BB_H5 | BB_H8 | BB_RANK_I, BB_RANK_A | BB_B2 | BB_B5 | BB_B8 | BB_RANK_C)
-
-        self.king_squares = [I5, A5]
-        self.promsui_squares = [H5, B5]
-        self.pieces = [NONE for i in SQUARES]
-        self.kings_living = [1, 1]
-
-        for i in SQUARES:
-            mask = BB_SQUARES[i]
-            for piece_type in PIECE_TYPES:
-                if mask & self.piece_bb[piece_type]:
-                    self.pieces[i] = piece_type
-
-        self.turn = BLACK
-        self.move_number = 1
-        self.captured_piece_stack = collections.deque()
-        self.move_stack = collections.deque()
-        self.incremental_zobrist_hash = self.board_zobrist_hash(DEFAULT_RANDOM_ARRAY)
-        self.transpositions = collections.Counter((self.zobrist_hash(), ))
+        self.set_sfen(STARTING_SFEN)
 
     def clear(self):
         self.piece_bb = [
@@ -609,9 +1221,11 @@ class Board(object):
                 BB_VOID,                       # PROM_SUI
         ]
 
-        self.pieces_in_hand = [collections.Counter(), collections.Counter()]
+        self.hands = [0, 0]
 
         self.occupied = Occupied(BB_VOID, BB_VOID)
+        self.sfen_ranks = [None for rank in range(9)]
+        self.sfen_hand = None
 
         self.king_squares = [None, None]
         self.promsui_squares = [None, None]
@@ -620,52 +1234,289 @@ class Board(object):
 
         self.turn = BLACK
         self.move_number = 1
-        self.captured_piece_stack = collections.deque()
-        self.move_stack = collections.deque()
+        self.states = []
+        self.root_position = None
         self.incremental_zobrist_hash = self.board_zobrist_hash(DEFAULT_RANDOM_ARRAY)
+        self.zobrist_key = self.compute_zobrist_hash()
+        if self.zobrist_key_high is not None:
+            self.zobrist_key_high = self.compute_zobrist_hash_high()
         self.transpositions = collections.Counter((self.zobrist_hash(), ))
 
-    def piece_at(self, square):
-        '''Gets the piece at the given square.'''
+        if self.track_attacks:
+            self.update_attack_maps()
+
+    def copy(self, stack=True):
+        '''
+        Returns a copy of the board without parsing or deep copying it.
+        With `stack=False` the copy has no move history, with an integer
+        only that many of the last moves can be popped. Partial histories
+        keep the repetition counts of the whole game.
+        '''
+        board = Board.__new__(type(self))
+        board.init_views()
+        if 'check_zobrist' in self.__dict__:
+            board.check_zobrist = self.check_zobrist
+
+        board.piece_bb = self.piece_bb[:]
+        board.hands = self.hands[:]
+        board.occupied = self.occupied.copy()
+        board.king_squares = self.king_squares[:]
+        board.promsui_squares = self.promsui_squares[:]
+        board.pieces = self.pieces[:]
+        board.kings_living = self.kings_living[:]
+        board.sfen_ranks = self.sfen_ranks[:]
+        board.sfen_hand = self.sfen_hand
+
+        board.turn = self.turn
+        board.move_number = self.move_number
+        board.incremental_zobrist_hash = self.incremental_zobrist_hash
+        board.zobrist_key = self.zobrist_key
+        board.zobrist_key_high = self.zobrist_key_high
+
+        # State records are never changed after the push, so they are shared.
+        if stack is True or stack >= len(self.states):
+            board.states = self.states[:]
+            board.root_position = self.root_position
+            board.transpositions = self.transpositions.copy()
+        elif stack:
+            board.states = self.states[len(self.states) - stack:]
+            board.root_position = None
+            board.transpositions = self.transpositions.copy()
+        else:
+            board.states = []
+            board.root_position = None
+            board.transpositions = collections.Counter((board.zobrist_key, ))
+
+        board.track_attacks = self.track_attacks
+        board.attack_maps = None
+        if self.attack_maps is not None:
+            board.attack_maps = self.attack_maps[:]
+            board.attack_counts = [self.attack_counts[BLACK][:], self.attack_counts[WHITE][:]]
+            board.piece_attacks = self.piece_attacks[:]
+
+        return board
+
+    def __copy__(self):
+        return self.copy()
+
+    def snapshot(self):
+        '''
+        Returns a token of the current state, including the move history,
+        that `restore()` can roll the board back to any number of times.
+        '''
+        attack_maps = None
+        if self.attack_maps is not None:
+            attack_maps = (self.attack_maps[:], [self.attack_counts[BLACK][:], self.attack_counts[WHITE][:]],
+                           self.piece_attacks[:])
+        return (self.piece_bb[:], self.hands[:], self.occupied.copy(), self.king_squares[:],
+                self.promsui_squares[:], self.pieces[:], self.kings_living[:], self.turn, self.move_number,
+                self.incremental_zobrist_hash, self.zobrist_key, self.zobrist_key_high,
+                tuple(self.states), self.root_position, self.transpositions.copy(), attack_maps)
+
+    def restore(self, snapshot):
+        '''Rolls the board back to a token returned by `snapshot()`.'''
+        (piece_bb, hands, occupied, king_squares, promsui_squares, pieces, kings_living, self.turn,
+         self.move_number, self.incremental_zobrist_hash, self.zobrist_key, self.zobrist_key_high,
+         states, self.root_position, transpositions, attack_maps) = snapshot
+
+        self.piece_bb = piece_bb[:]
+        self.hands = hands[:]
+        self.occupied = occupied.copy()
+        self.king_squares = king_squares[:]
+        self.promsui_squares = promsui_squares[:]
+        self.pieces = pieces[:]
+        self.kings_living = kings_living[:]
+        self.sfen_ranks = [None for rank in range(9)]
+        self.sfen_hand = None
+        self.states = list(states)
+        self.transpositions = transpositions.copy()
+
+        if attack_maps is None:
+            self.track_attacks = False
+            self.attack_maps = None
+        else:
+            self.track_attacks = True
+            self.attack_maps = attack_maps[0][:]
+            self.attack_counts = [attack_maps[1][BLACK][:], attack_maps[1][WHITE][:]]
+            self.piece_attacks = attack_maps[2][:]
+
+    def packed_position(self):
+        '''
+        Returns the position without the move history as a small tuple,
+        for keeping many positions in memory. See `from_packed_position()`.
+        '''
+        return (bytes(bytearray(self.pieces)), self.occupied.by_color[BLACK], self.occupied.by_color[WHITE],
+                tuple(self.hands), self.turn, self.move_number, self.incremental_zobrist_hash,
+                self.zobrist_key, self.zobrist_key_high)
+
+    @classmethod
+    def from_packed_position(cls, position, track_attacks=False):
+        '''
+        Creates a board from a tuple returned by `packed_position()` without
+        parsing a SFEN. The board has no move history.
+        '''
+        (pieces, occupied_by_black, occupied_by_white, hands, turn, move_number, incremental_zobrist_hash,
+         zobrist_key, zobrist_key_high) = position
+
+        board = cls.__new__(cls)
+        board.init_views()
+        board.pieces = list(bytearray(pieces))
+        board.piece_bb = [BB_VOID for piece_type in PIECE_TYPES_WITH_NONE]
+        board.occupied = Occupied(occupied_by_black, occupied_by_white)
+        board.king_squares = [None, None]
+        board.promsui_squares = [None, None]
+        board.kings_living = [0, 0]
+        for square, piece_type in enumerate(board.pieces):
+            if piece_type:
+                mask = BB_SQUARES[square]
+                board.piece_bb[piece_type] |= mask
+                if piece_type == KING or piece_type == PROM_SUI:
+                    color = WHITE if occupied_by_white & mask else BLACK
+                    if piece_type == KING:
+                        board.king_squares[color] = square
+                    else:
+                        board.promsui_squares[color] = square
+                    board.kings_living[color] += 1
+
+        board.hands = list(hands)
+        board.turn = turn
+        board.move_number = move_number
+        board.incremental_zobrist_hash = incremental_zobrist_hash
+        board.zobrist_key = zobrist_key
+        board.zobrist_key_high = zobrist_key_high
+        board.sfen_ranks = [None for rank in range(9)]
+        board.sfen_hand = None
+        board.states = []
+        board.root_position = None
+        board.transpositions = collections.Counter((zobrist_key, ))
+
+        board.track_attacks = track_attacks
+        board.attack_maps = None
+        if track_attacks:
+            board.update_attack_maps()
+
+        return board
+
+    def enable_attack_maps(self):
+        '''
+        Starts keeping the attacks of every piece, the number of attackers of
+        each square and the mask of attacked squares of each side up to date
+        in `set_piece_at()` and `remove_piece_at()`. Making moves gets
+        slower, while `is_attacked_by()` and `is_check()` become mask tests.
+        '''
+        self.track_attacks = True
+        self.update_attack_maps()
+
+    def disable_attack_maps(self):
+        '''Stops keeping the attack maps up to date.'''
+        self.track_attacks = False
+        self.attack_maps = None
+        self.attack_counts = None
+        self.piece_attacks = None
+
+    def update_attack_maps(self):
+        '''Computes the attack maps from scratch.'''
+        self.attack_maps = [BB_VOID, BB_VOID]
+        self.attack_counts = [[0 for i in SQUARES], [0 for i in SQUARES]]
+        self.piece_attacks = [BB_VOID for i in SQUARES]
+        for color in COLORS:
+            squares = self.occupied.by_color[color]
+            while squares:
+                mask = squares & -squares
+                squares ^= mask
+                square = mask.bit_length() - 1
+                attacks = Board.attacks_from(self.pieces[square], square, self.occupied, color)
+                self.piece_attacks[square] = attacks
+                self.add_attack_counts(color, attacks, 1)
+
+    def add_attack_counts(self, color, mask, delta):
+        counts = self.attack_counts[color]
+        attack_map = self.attack_maps[color]
+        while mask:
+            square_mask = mask & -mask
+            mask ^= square_mask
+            square = square_mask.bit_length() - 1
+            count = counts[square] + delta
+            counts[square] = count
+            if count == 0 or (count == 1 and delta > 0):
+                attack_map ^= square_mask
+        self.attack_maps[color] = attack_map
+
+    def update_sliding_attacks_through(self, square):
+        '''
+        Updates the attacks of the sliding pieces reaching the given square
+        after it got empty or occupied.
+        '''
         mask = BB_SQUARES[square]
-        color = int(bool(self.occupied[WHITE] & mask))
+        piece_bb = self.piece_bb
+        occupied = self.occupied
+        sliders = (piece_bb[LANCE] | piece_bb[BISHOP] | piece_bb[ROOK] |
+                   piece_bb[PROM_BISHOP] | piece_bb[PROM_ROOK]) & ~mask
+        while sliders:
+            slider_mask = sliders & -sliders
+            sliders ^= slider_mask
+            slider_square = slider_mask.bit_length() - 1
+            attacks = self.piece_attacks[slider_square]
+            if not attacks & mask:
+                continue
+            color = int(bool(occupied.by_color[WHITE] & slider_mask))
+            new_attacks = Board.attacks_from(self.pieces[slider_square], slider_square, occupied, color)
+            self.piece_attacks[slider_square] = new_attacks
+            self.add_attack_counts(color, attacks & ~new_attacks, -1)
+            self.add_attack_counts(color, new_attacks & ~attacks, 1)
 
-        piece_type = self.piece_type_at(square)
+    def piece_at(self, square):
+        '''Gets the piece at the given square.'''
+        piece_type = self.pieces[square]
         if piece_type:
-            return Piece(piece_type, color)
+            return PIECES[int(bool(self.occupied.by_color[WHITE] & BB_SQUARES[square]))][piece_type]
 
     def piece_type_at(self, square):
         '''Gets the piece type at the given square.'''
         return self.pieces[square]
 
     def add_piece_into_hand(self, piece_type, color, count=1):
-        p = self.pieces_in_hand[color]
-
-        if piece_type in [KING, SUI, PROM_SUI]:
+        if piece_type in PIECE_TYPES_NOT_IN_HAND:
             return
 
-        if piece_type >= PROM_PAWN:
-            piece_type = PIECE_PROMOTED.index(piece_type)
-        p[piece_type] += count
+        piece_type = PIECE_UNPROMOTED[piece_type]
+        shift = HAND_SHIFTS[piece_type]
+        hand = self.hands[color]
+        total = ((hand >> shift) & HAND_COUNT_MAX) + count
+        if count < 0 or total > HAND_COUNT_MAX:
+            raise ValueError('Too many pieces in hand: {0}'.format(PIECES[color][piece_type]))
+        self.hands[color] = hand + (count << shift)
+        self.sfen_hand = None
+
+        # Update incremental zobrist hash.
+        key_index = (color * 8 + piece_type) * (HAND_COUNT_MAX + 1) + total
+        self.zobrist_key ^= ZOBRIST_HAND_KEYS[key_index - count] ^ ZOBRIST_HAND_KEYS[key_index]
+        if self.zobrist_key_high is not None:
+            self.zobrist_key_high ^= ZOBRIST_HIGH_HAND_KEYS[key_index - count] ^ ZOBRIST_HIGH_HAND_KEYS[key_index]
 
     def remove_piece_from_hand(self, piece_type, color):
-        p = self.pieces_in_hand[color]
-        if piece_type >= PROM_PAWN:
-            piece_type = PIECE_PROMOTED.index(piece_type)
-        p[piece_type] -= 1
-        if p[piece_type] == 0:
-            del p[piece_type]
-        elif p[piece_type] < 0:
-            raise ValueError('The piece is not in hand: {0}'.format(Piece(piece_type, self.turn)))
+        piece_type = PIECE_UNPROMOTED[piece_type]
+        shift = HAND_SHIFTS[piece_type]
+        hand = self.hands[color]
+        count = (hand >> shift) & HAND_COUNT_MAX
+        if not count:
+            raise ValueError('The piece is not in hand: {0}'.format(PIECES[color][piece_type]))
+        self.hands[color] = hand - (1 << shift)
+        self.sfen_hand = None
+
+        # Update incremental zobrist hash.
+        key_index = (color * 8 + piece_type) * (HAND_COUNT_MAX + 1) + count
+        self.zobrist_key ^= ZOBRIST_HAND_KEYS[key_index] ^ ZOBRIST_HAND_KEYS[key_index - 1]
+        if self.zobrist_key_high is not None:
+            self.zobrist_key_high ^= ZOBRIST_HIGH_HAND_KEYS[key_index] ^ ZOBRIST_HIGH_HAND_KEYS[key_index - 1]
 
     def has_piece_in_hand(self, piece_type, color):
-        if piece_type >= PROM_PAWN:
-            piece_type = PIECE_PROMOTED.index(piece_type)
-        return piece_type in self.pieces_in_hand[color]
+        shift = HAND_SHIFTS[PIECE_UNPROMOTED[piece_type]]
+        return shift is not None and bool((self.hands[color] >> shift) & HAND_COUNT_MAX)
 
     def remove_piece_at(self, square, into_hand=False):
         '''Removes a piece from the given square if present.'''
-        piece_type = self.piece_type_at(square)
+        piece_type = self.pieces[square]
 
         if piece_type == NONE:
             return
@@ -677,58 +1528,79 @@ class Board(object):
 
         self.piece_bb[piece_type] ^= mask
 
-        color = int(bool(self.occupied[WHITE] & mask))
+        color = int(bool(self.occupied.by_color[WHITE] & mask))
 
         self.pieces[square] = NONE
         self.occupied.ixor(mask, color, square)
+        self.sfen_ranks[square // 9] = None
 
-        if piece_type in [KING, PROM_SUI]:
+        if self.attack_maps is not None:
+            self.add_attack_counts(color, self.piece_attacks[square], -1)
+            self.piece_attacks[square] = BB_VOID
+            self.update_sliding_attacks_through(square)
+
+        if piece_type == KING or piece_type == PROM_SUI:
             self.kings_living[color] -= 1
 
         # Update incremental zobrist hash.
-        if color == BLACK:
-            piece_index = (piece_type - 1) * 2
-        else:
-            piece_index = (piece_type - 1) * 2 + 1
-        self.incremental_zobrist_hash ^= DEFAULT_RANDOM_ARRAY[81 * piece_index + 9 * rank_index(square) + file_index(square)]
+        key_index = 81 * ((piece_type - 1) * 2 + color) + square
+        key = DEFAULT_RANDOM_ARRAY[key_index]
+        self.incremental_zobrist_hash ^= key
+        self.zobrist_key ^= key
+        if self.zobrist_key_high is not None:
+            self.zobrist_key_high ^= ZOBRIST_HIGH_PIECE_KEYS[key_index]
 
     def set_piece_at(self, square, piece, from_hand=False, into_hand=False):
         '''Sets a piece at the given square. An existing piece is replaced.'''
+        self.set_piece_type_at(square, piece.piece_type, piece.color, from_hand, into_hand)
+
+    def set_piece_type_at(self, square, piece_type, color, from_hand=False, into_hand=False):
+        '''
+        Sets a piece given by its type and color at the given square.
+        An existing piece is replaced.
+        '''
         if from_hand:
-            self.remove_piece_from_hand(piece.piece_type, self.turn)
+            self.remove_piece_from_hand(piece_type, self.turn)
 
-        self.remove_piece_at(square, into_hand)
+        if self.pieces[square]:
+            self.remove_piece_at(square, into_hand)
 
-        self.pieces[square] = piece.piece_type
+        self.pieces[square] = piece_type
+        self.sfen_ranks[square // 9] = None
 
         mask = BB_SQUARES[square]
 
-        piece_type = piece.piece_type
-
         self.piece_bb[piece_type] |= mask
 
         if piece_type == KING:
-            self.king_squares[piece.color] = square
-            self.kings_living[piece.color] += 1
-        if piece_type == PROM_SUI:
-            self.promsui_squares[piece.color] = square
-            self.kings_living[piece.color] += 1
+            self.king_squares[color] = square
+            self.kings_living[color] += 1
+        elif piece_type == PROM_SUI:
+            self.promsui_squares[color] = square
+            self.kings_living[color] += 1
 
-        self.occupied.ixor(mask, piece.color, square)
+        self.occupied.ixor(mask, color, square)
+
+        if self.attack_maps is not None:
+            self.update_sliding_attacks_through(square)
+            attacks = Board.attacks_from(piece_type, square, self.occupied, color)
+            self.piece_attacks[square] = attacks
+            self.add_attack_counts(color, attacks, 1)
 
         # Update incremental zorbist hash.
-        if piece.color == BLACK:
-            piece_index = (piece.piece_type - 1) * 2
-        else:
-            piece_index = (piece.piece_type - 1) * 2 + 1
-        self.incremental_zobrist_hash ^= DEFAULT_RANDOM_ARRAY[81 * piece_index + 9 * rank_index(square) + file_index(square)]
+        key_index = 81 * ((piece_type - 1) * 2 + color) + square
+        key = DEFAULT_RANDOM_ARRAY[key_index]
+        self.incremental_zobrist_hash ^= key
+        self.zobrist_key ^= key
+        if self.zobrist_key_high is not None:
+            self.zobrist_key_high ^= ZOBRIST_HIGH_PIECE_KEYS[key_index]
 
     def generate_pseudo_legal_moves(self, pawns=True, lances=True, knights=True, silvers=True, golds=True,
             bishops=True, rooks=True,
             kings=True,
             prom_pawns=True, prom_lances=True, prom_knights=True, prom_silvers=True, prom_bishops=True, prom_rooks=True,
             pawns_drop=True, lances_drop=True, knights_drop=True, silvers_drop=True, golds_drop=True,
-            bishops_drop=True, rooks_drop=True, sui=True, prom_sui=True):
+            bishops_drop=True, rooks_drop=True, sui=True, prom_sui=True, targets=BB_ALL, drop_targets=BB_ALL):
 
         move_flags = [False,
                       pawns, lances, knights, silvers,
@@ -740,25 +1612,37 @@ class Board(object):
                       pawns_drop, lances_drop, knights_drop, silvers_drop,
                       golds_drop, bishops_drop, rooks_drop]
 
+        occupied = self.occupied
+        occupied_by_turn = occupied.by_color[self.turn]
+
         for piece_type in PIECE_TYPES:
             # piece move
             if move_flags[piece_type]:
-                movers = self.piece_bb[piece_type] & self.occupied[self.turn]
+                movers = self.piece_bb[piece_type] & occupied_by_turn
+                if not movers:
+                    continue
+                step_index = (piece_type * 2 + self.turn) * 81
+                sliding_attacks = PIECE_SLIDING_ATTACKS[piece_type]
                 from_square = bit_scan(movers)
 
                 while from_square != -1 and from_square is not None:
-                    moves = Board.attacks_from(piece_type, from_square, self.occupied, self.turn) & ~self.occupied[self.turn]
+                    moves = BB_STEP_ATTACKS[step_index + from_square]
+                    if sliding_attacks is not None:
+                        moves |= sliding_attacks(from_square, occupied, self.turn)
+                    moves &= ~occupied_by_turn
+                    if piece_type not in ROYAL_OR_SUI_PIECE_TYPES:
+                        moves &= targets
                     to_square = bit_scan(moves)
                     while to_square != - 1 and to_square is not None:
                         if can_move_without_promotion(to_square, piece_type, self.turn):
-                            yield Move(from_square, to_square)
+                            yield MOVES_BY_INT[to_square | from_square << 7]
                         if can_promote(from_square, piece_type, self.turn) or can_promote(to_square, piece_type, self.turn):
-                            yield Move(from_square, to_square, True)
+                            yield MOVES_BY_INT[to_square | from_square << 7 | 1 << 14]
                         to_square = bit_scan(moves, to_square + 1)
                     from_square = bit_scan(movers, from_square + 1)
 
         # Drop pieces in hand.
-        moves = self.occupied.non_occupied()
+        moves = self.occupied.non_occupied() & drop_targets
         to_square = bit_scan(moves)
 
         while to_square != -1 and to_square is not None:
@@ -768,66 +1652,514 @@ class Board(object):
                 if drop_flags[piece_type] and self.has_piece_in_hand(piece_type, self.turn) and \
                         can_move_without_promotion(to_square, piece_type, self.turn) and \
                         not self.is_double_pawn(to_square, piece_type):
-                    yield Move(None, to_square, False, piece_type)
+                    yield MOVES_BY_INT[to_square | (81 + piece_type) << 7]
 
             to_square = bit_scan(moves, to_square + 1)
 
+    def generate_pseudo_legal_move_ints(self, targets=BB_ALL, drop_targets=BB_ALL):
+        '''
+        Generates pseudo legal moves packed into integers (see `Move.to_int()`)
+        in the same order as `generate_pseudo_legal_moves()`.
+        Destinations of pieces other than kings and sui are limited to
+        `targets`, those of drops to `drop_targets`.
+        '''
+        turn = self.turn
+        occupied = self.occupied
+        occupied_by_turn = occupied.by_color[turn]
+        free = ~occupied_by_turn & BB_ALL
+        promotion_zone = BB_PROMOTION_ZONES[turn]
+        dead_squares = BB_DEAD_SQUARES[turn]
+        piece_bb = self.piece_bb
+
+        for piece_type in PIECE_TYPES:
+            movers = piece_bb[piece_type] & occupied_by_turn
+            if not movers:
+                continue
+            step_index = (piece_type * 2 + turn) * 81
+            sliding_attacks = PIECE_SLIDING_ATTACKS[piece_type]
+            can_promote = PIECE_PROMOTED[piece_type] is not None
+            dead = dead_squares[piece_type]
+            piece_targets = free if piece_type in ROYAL_OR_SUI_PIECE_TYPES else free & targets
+
+            while movers:
+                from_mask = movers & -movers
+                movers ^= from_mask
+                from_square = from_mask.bit_length() - 1
+
+                moves = BB_STEP_ATTACKS[step_index + from_square]
+                if sliding_attacks is not None:
+                    moves |= sliding_attacks(from_square, occupied, turn)
+                moves &= piece_targets
+                from_bits = from_square << 7
+
+                if not can_promote:
+                    while moves:
+                        to_mask = moves & -moves
+                        moves ^= to_mask
+                        yield from_bits | (to_mask.bit_length() - 1)
+                elif from_mask & promotion_zone:
+                    while moves:
+                        to_mask = moves & -moves
+                        moves ^= to_mask
+                        move_int = from_bits | (to_mask.bit_length() - 1)
+                        if not to_mask & dead:
+                            yield move_int
+                        yield move_int | 16384
+                else:
+                    while moves:
+                        to_mask = moves & -moves
+                        moves ^= to_mask
+                        move_int = from_bits | (to_mask.bit_length() - 1)
+                        if not to_mask & dead:
+                            yield move_int
+                        if to_mask & promotion_zone:
+                            yield move_int | 16384
+
+        # Drop pieces in hand.
+        drop_masks = [((81 + piece_type) << 7, mask) for piece_type, mask in self.drop_masks(drop_targets)]
+        if not drop_masks:
+            return
+        empty = occupied.non_occupied() & drop_targets
+
+        while empty:
+            to_mask = empty & -empty
+            empty ^= to_mask
+            to_square = to_mask.bit_length() - 1
+            for drop_bits, mask in drop_masks:
+                if mask & to_mask:
+                    yield drop_bits | to_square
+
+    def generate_legal_move_ints(self):
+        '''
+        Generates legal moves packed into integers.
+        '''
+        if self.is_check():
+            return self.generate_evasion_move_ints()
+        return self.filter_legal_move_ints(self.generate_pseudo_legal_move_ints())
+
+    def evasion_targets(self):
+        '''
+        Gets the destination masks `(targets, drop_targets)` of pieces other
+        than kings and of drops which can answer a check: capturing the
+        checker or interposing. Both are empty in double check and full when
+        the side to move is not in check.
+        '''
+        checkers = self.checkers_mask()
+        if not checkers:
+            return BB_ALL, BB_ALL
+        if checkers & (checkers - 1):
+            return BB_VOID, BB_VOID
+        between = BB_BETWEEN[self.royal_square(self.turn) * 81 + checkers.bit_length() - 1]
+        return between | checkers, between
+
+    def generate_evasion_move_ints(self):
+        '''
+        Generates legal moves packed into integers when the side to move is
+        in check, in the same order as `generate_legal_move_ints()`. Only king
+        moves, captures of the checker and interpositions are considered.
+        '''
+        targets, drop_targets = self.evasion_targets()
+        return self.filter_legal_move_ints(self.generate_pseudo_legal_move_ints(targets, drop_targets))
+
+    def drop_masks(self, drop_targets=BB_ALL):
+        '''
+        Gets a list of `(piece_type, mask)` with the squares each piece in
+        hand of the side to move can be dropped to.
+        '''
+        turn = self.turn
+        hand = self.hands[turn]
+        if not hand:
+            return []
+
+        empty = self.occupied.non_occupied() & drop_targets
+        dead_squares = BB_DEAD_SQUARES[turn]
+        drop_masks = []
+        for piece_type in range(PAWN, KING):
+            if (hand >> HAND_SHIFTS[piece_type]) & HAND_COUNT_MAX:
+                mask = empty & ~dead_squares[piece_type]
+                if piece_type == PAWN:
+                    # No double pawns.
+                    pawns = self.piece_bb[PAWN] & self.occupied.by_color[turn]
+                    while pawns:
+                        pawn_mask = pawns & -pawns
+                        pawns ^= pawn_mask
+                        mask &= ~BB_FILES[file_index(pawn_mask.bit_length() - 1)]
+                drop_masks.append((piece_type, mask))
+        return drop_masks
+
+    def count_pseudo_legal_moves(self):
+        '''
+        Counts pseudo legal moves from the popcounts of the attack masks,
+        without generating them.
+        '''
+        turn = self.turn
+        occupied = self.occupied
+        occupied_by_turn = occupied.by_color[turn]
+        free = ~occupied_by_turn & BB_ALL
+        promotion_zone = BB_PROMOTION_ZONES[turn]
+        dead_squares = BB_DEAD_SQUARES[turn]
+        count = 0
+
+        for piece_type in PIECE_TYPES:
+            movers = self.piece_bb[piece_type] & occupied_by_turn
+            if not movers:
+                continue
+            step_index = (piece_type * 2 + turn) * 81
+            sliding_attacks = PIECE_SLIDING_ATTACKS[piece_type]
+            can_promote = PIECE_PROMOTED[piece_type] is not None
+            not_dead = ~dead_squares[piece_type]
+
+            while movers:
+                from_mask = movers & -movers
+                movers ^= from_mask
+                from_square = from_mask.bit_length() - 1
+
+                moves = BB_STEP_ATTACKS[step_index + from_square]
+                if sliding_attacks is not None:
+                    moves |= sliding_attacks(from_square, occupied, turn)
+                moves &= free
+
+                count += pop_count(moves & not_dead)
+                if can_promote:
+                    if not from_mask & promotion_zone:
+                        moves &= promotion_zone
+                    count += pop_count(moves)
+
+        for piece_type, mask in self.drop_masks():
+            count += pop_count(mask)
+
+        return count
+
+    def count_legal_moves(self):
+        '''
+        Counts legal moves without generating them. Moves are only tried one
+        by one for the king, for pawn drops giving check and for promotions
+        of a sui when there is no king.
+        '''
+        turn = self.turn
+        occupied = self.occupied
+        occupied_by_turn = occupied.by_color[turn]
+        free = ~occupied_by_turn & BB_ALL
+        promotion_zone = BB_PROMOTION_ZONES[turn]
+        dead_squares = BB_DEAD_SQUARES[turn]
+        kings_living = self.kings_living[turn]
+        royal_square = self.royal_square(turn)
+        targets, drop_targets = self.evasion_targets()
+        pinned = self.pinned_mask()
+        count = 0
+
+        for piece_type in PIECE_TYPES:
+            movers = self.piece_bb[piece_type] & occupied_by_turn
+            if not movers:
+                continue
+            step_index = (piece_type * 2 + turn) * 81
+            sliding_attacks = PIECE_SLIDING_ATTACKS[piece_type]
+            can_promote = PIECE_PROMOTED[piece_type] is not None
+            not_dead = ~dead_squares[piece_type]
+
+            while movers:
+                from_mask = movers & -movers
+                movers ^= from_mask
+                from_square = from_mask.bit_length() - 1
+
+                moves = BB_STEP_ATTACKS[step_index + from_square]
+                if sliding_attacks is not None:
+                    moves |= sliding_attacks(from_square, occupied, turn)
+                moves &= free
+
+                if from_square == royal_square:
+                    while moves:
+                        to_mask = moves & -moves
+                        moves ^= to_mask
+                        if not self.is_attacked_by_without(turn ^ 1, to_mask.bit_length() - 1, from_square):
+                            count += 1
+                    continue
+
+                legal_moves = moves
+                if royal_square is not None:
+                    legal_moves &= targets
+                    if from_mask & pinned:
+                        legal_moves &= BB_LINES[royal_square * 81 + from_square]
+                count += pop_count(legal_moves & not_dead)
+
+                if can_promote:
+                    # A promoted sui is one more king.
+                    if piece_type == SUI:
+                        legal_moves = moves
+                    if not from_mask & promotion_zone:
+                        legal_moves &= promotion_zone
+                    if piece_type == SUI and kings_living == 0:
+                        while legal_moves:
+                            to_mask = legal_moves & -legal_moves
+                            legal_moves ^= to_mask
+                            self.push_int(to_mask.bit_length() - 1 | from_square << 7 | 16384)
+                            if not self.was_suicide():
+                                count += 1
+                            self.pop()
+                    else:
+                        count += pop_count(legal_moves)
+
+        # Only a pawn attacking the only king of the other side can be mate.
+        if self.kings_living[turn ^ 1] == 1:
+            pawn_checks = BB_PAWN_ATTACKS[turn ^ 1][self.royal_square(turn ^ 1)]
+        else:
+            pawn_checks = BB_VOID
+
+        for piece_type, mask in self.drop_masks(drop_targets if royal_square is not None else BB_ALL):
+            count += pop_count(mask)
+            if piece_type == PAWN and mask & pawn_checks:
+                to_square = pawn_checks.bit_length() - 1
+                self.push_int(to_square | (81 + PAWN) << 7)
+                if self.was_check_by_dropping_pawn_at(to_square):
+                    count -= 1
+                self.pop()
+
+        return count
+
+    def filter_legal_move_ints(self, move_ints):
+        '''
+        Filters pseudo legal moves packed into integers down to the legal ones.
+        Checkers and pinned pieces are computed once, so only pawn drops
+        giving check (and promotions of a sui when there is no king) are
+        tried on the board.
+        '''
+        turn = self.turn
+        pieces = self.pieces
+        kings_living = self.kings_living[turn]
+        royal_square = self.royal_square(turn)
+
+        if royal_square is not None:
+            checkers = self.checkers_mask()
+            pinned = self.pinned_mask()
+            if not checkers:
+                targets = BB_ALL
+                drop_targets = BB_ALL
+            elif checkers & (checkers - 1):
+                # Double check: only the king can move.
+                targets = BB_VOID
+                drop_targets = BB_VOID
+            else:
+                checker_square = checkers.bit_length() - 1
+                drop_targets = BB_BETWEEN[royal_square * 81 + checker_square]
+                targets = drop_targets | checkers
+
+        # Only a pawn attacking the only king of the other side can be mate.
+        if self.kings_living[turn ^ 1] == 1:
+            other_royal_square = self.royal_square(turn ^ 1)
+            pawn_checks = BB_PAWN_ATTACKS[turn ^ 1][other_royal_square]
+        else:
+            pawn_checks = BB_VOID
+
+        for move_int in move_ints:
+            to_square = move_int & 127
+            from_square = (move_int >> 7) & 127
+
+            if from_square >= 81:
+                if royal_square is not None and not BB_SQUARES[to_square] & drop_targets:
+                    continue
+                if from_square == 81 + PAWN and BB_SQUARES[to_square] & pawn_checks:
+                    self.push_int(move_int)
+                    is_legal = not self.was_check_by_dropping_pawn_at(to_square)
+                    self.pop()
+                    if not is_legal:
+                        continue
+                yield move_int
+            elif move_int >> 14 and pieces[from_square] == SUI:
+                # A promoted sui is one more king.
+                if kings_living == 0:
+                    self.push_int(move_int)
+                    is_legal = not self.was_suicide()
+                    self.pop()
+                    if not is_legal:
+                        continue
+                yield move_int
+            elif royal_square is None:
+                yield move_int
+            elif from_square == royal_square:
+                if not self.is_attacked_by_without(turn ^ 1, to_square, royal_square):
+                    yield move_int
+            elif BB_SQUARES[to_square] & targets and (
+                    not BB_SQUARES[from_square] & pinned or
+                    BB_SQUARES[to_square] & BB_LINES[royal_square * 81 + from_square]):
+                yield move_int
+
     def is_attacked_by(self, color, square, piece_types=PIECE_TYPES):
         if square is None:
             return False
 
+        if self.attack_maps is not None and piece_types is PIECE_TYPES:
+            return bool(self.attack_maps[color] & BB_SQUARES[square])
+
+        occupied = self.occupied
+        occupied_by_color = occupied.by_color[color]
+        piece_bb = self.piece_bb
+        # Attacks are symmetric: look from the square with the opposite color.
+        index = (color ^ 1) * 81 + square
         for piece_type in piece_types:
-            is_attacked = Board.attacks_from(piece_type, square, self.occupied, color ^ 1) & self.piece_bb[piece_type] & self.occupied[color]
-            if is_attacked:
+            pieces = piece_bb[piece_type] & occupied_by_color
+            if not pieces:
+                continue
+            attacks = BB_STEP_ATTACKS[piece_type * 162 + index]
+            sliding_attacks = PIECE_SLIDING_ATTACKS[piece_type]
+            if sliding_attacks is not None:
+                attacks |= sliding_attacks(square, occupied, color ^ 1)
+            if attacks & pieces:
                 return True
 
         return False
 
+    def is_attacked_by_without(self, color, square, without_square):
+        '''
+        Checks if the given square is attacked by `color` after the piece on
+        `without_square` is taken off the board, like when a king moves away
+        along the line of a sliding piece.
+        '''
+        occupied = self.occupied
+        without_mask = BB_SQUARES[without_square]
+        without_color = int(bool(occupied.by_color[WHITE] & without_mask))
+
+        if self.attack_maps is None:
+            occupied.ixor(without_mask, without_color, without_square)
+            is_attacked = self.is_attacked_by(color, square)
+            occupied.ixor(without_mask, without_color, without_square)
+            return is_attacked
+
+        if self.attack_maps[color] & BB_SQUARES[square]:
+            return True
+
+        # Only sliding pieces reaching the removed piece can see further.
+        piece_bb = self.piece_bb
+        sliders = (piece_bb[LANCE] | piece_bb[BISHOP] | piece_bb[ROOK] |
+                   piece_bb[PROM_BISHOP] | piece_bb[PROM_ROOK]) & occupied.by_color[color]
+        is_attacked = False
+        occupied.ixor(without_mask, without_color, without_square)
+        while sliders:
+            slider_mask = sliders & -sliders
+            sliders ^= slider_mask
+            slider_square = slider_mask.bit_length() - 1
+            if self.piece_attacks[slider_square] & without_mask and Board.attacks_from(
+                    self.pieces[slider_square], slider_square, occupied, color) & BB_SQUARES[square]:
+                is_attacked = True
+                break
+        occupied.ixor(without_mask, without_color, without_square)
+        return is_attacked
+
     def attacker_mask(self, color, square):
+        if self.attack_maps is not None and not self.attack_maps[color] & BB_SQUARES[square]:
+            return BB_VOID
+
+        occupied = self.occupied
+        occupied_by_color = occupied.by_color[color]
+        piece_bb = self.piece_bb
+        index = (color ^ 1) * 81 + square
         attackers = BB_VOID
         for piece_type in PIECE_TYPES:
-            attackers |= Board.attacks_from(piece_type, square, self.occupied, color ^ 1) & self.piece_bb[piece_type]
-        return attackers & self.occupied[color]
+            pieces = piece_bb[piece_type] & occupied_by_color
+            if not pieces:
+                continue
+            attacks = BB_STEP_ATTACKS[piece_type * 162 + index]
+            sliding_attacks = PIECE_SLIDING_ATTACKS[piece_type]
+            if sliding_attacks is not None:
+                attacks |= sliding_attacks(square, occupied, color ^ 1)
+            attackers |= attacks & pieces
+        return attackers
 
     def attackers(self, color, square):
         return SquareSet(self.attacker_mask(color, square))
 
+    def attackers_to(self, square, occupied=None):
+        '''
+        Gets a mask of the pieces of both sides attacking the given square.
+        Pieces moving alike are looked up together: gold and the promoted
+        minor pieces, king, promoted sui and the king steps of horse and
+        dragon, and the diagonal and orthogonal sliding pieces.
+        An `occupied` bitboard (or `Occupied`) replaces the occupancy, so
+        pieces behind the ones taken out of it are found as well. Pieces
+        not in it are left out.
+        '''
+        if occupied is None:
+            occupied = self.occupied
+        elif not isinstance(occupied, Occupied):
+            occupied = Occupied(occupied & BB_ALL, BB_VOID)
+
+        piece_bb = self.piece_bb
+        golds = (piece_bb[GOLD] | piece_bb[PROM_PAWN] | piece_bb[PROM_LANCE] |
+                 piece_bb[PROM_KNIGHT] | piece_bb[PROM_SILVER])
+        attackers = (
+            BB_STEP_ATTACKS[KING * 162 + square] &
+            (piece_bb[KING] | piece_bb[PROM_SUI] | piece_bb[PROM_BISHOP] | piece_bb[PROM_ROOK]) |
+            bishop_attacks(square, occupied) & (piece_bb[BISHOP] | piece_bb[PROM_BISHOP]) |
+            rook_attacks(square, occupied) & (piece_bb[ROOK] | piece_bb[PROM_ROOK]))
+
+        for color in COLORS:
+            # Attacks are symmetric: look from the square with the opposite color.
+            index = (color ^ 1) * 81 + square
+            attackers |= self.occupied.by_color[color] & (
+                BB_STEP_ATTACKS[PAWN * 162 + index] & piece_bb[PAWN] |
+                BB_STEP_ATTACKS[KNIGHT * 162 + index] & piece_bb[KNIGHT] |
+                BB_STEP_ATTACKS[SILVER * 162 + index] & piece_bb[SILVER] |
+                BB_STEP_ATTACKS[GOLD * 162 + index] & golds |
+                BB_STEP_ATTACKS[SUI * 162 + index] & piece_bb[SUI] |
+                lance_attacks(square, occupied, color ^ 1) & piece_bb[LANCE])
+
+        return attackers & occupied.bits
+
     def is_check(self):
-        return self.kings_living[self.turn] == 1 and (self.is_attacked_by(self.turn ^ 1,
-            self.king_squares[self.turn]) or self.is_attacked_by(self.turn ^ 1, self.promsui_squares[self.turn]))
+        return self.is_attacked_by(self.turn ^ 1, self.royal_square(self.turn))
+
+    def royal_square(self, color):
+        '''
+        Gets the square of the king (or promoted sui) of the given side, if
+        it is the only one. Otherwise there is no check and `None` is
+        returned.
+        '''
+        if self.kings_living[color] != 1:
+            return None
+        royals = (self.piece_bb[KING] | self.piece_bb[PROM_SUI]) & self.occupied.by_color[color]
+        return royals.bit_length() - 1
+
+    def checkers_mask(self):
+        '''
+        Gets a mask of the pieces giving check to the side to move.
+        '''
+        royal_square = self.royal_square(self.turn)
+        if royal_square is None:
+            return BB_VOID
+        return self.attacker_mask(self.turn ^ 1, royal_square)
+
+    def pinned_mask(self):
+        '''
+        Gets a mask of the pieces of the side to move which can not leave
+        the line between their king and an attacking sliding piece.
+        '''
+        royal_square = self.royal_square(self.turn)
+        if royal_square is None:
+            return BB_VOID
+
+        occupied = self.occupied
+        occupied_by_turn = occupied.by_color[self.turn]
+        occupied_by_other = occupied.by_color[self.turn ^ 1]
+        pinned = BB_VOID
+        for piece_type in (LANCE, BISHOP, ROOK, PROM_BISHOP, PROM_ROOK):
+            snipers = self.piece_bb[piece_type] & occupied_by_other
+            if not snipers:
+                continue
+            snipers &= PIECE_SLIDING_ATTACKS[piece_type](royal_square, OCCUPIED_EMPTY, self.turn)
+            while snipers:
+                sniper = snipers & -snipers
+                snipers ^= sniper
+                blockers = BB_BETWEEN[royal_square * 81 + sniper.bit_length() - 1] & occupied.bits
+                if blockers and not blockers & (blockers - 1) and blockers & occupied_by_turn:
+                    pinned |= blockers
+        return pinned
 
     @staticmethod
     def attacks_from(piece_type, square, occupied, move_color):
-        if piece_type == NONE:
-            return BB_VOID
-        if piece_type == PAWN:
-            return BB_PAWN_ATTACKS[move_color][square]
-        elif piece_type == LANCE:
-            return BB_LANCE_ATTACKS[move_color][square][(occupied.l90 >> (((square % 9) * 9) + 1)) & 127]
-        elif piece_type == KNIGHT:
-            return BB_KNIGHT_ATTACKS[move_color][square]
-        elif piece_type == SILVER:
-            return BB_SILVER_ATTACKS[move_color][square]
-        elif piece_type in [GOLD, PROM_PAWN, PROM_LANCE, PROM_KNIGHT, PROM_SILVER]:
-            return BB_GOLD_ATTACKS[move_color][square]
-        elif piece_type == BISHOP:
-            return (BB_R45_ATTACKS[square][(occupied.r45 >> BB_SHIFT_R45[square]) & 127] |
-                    BB_L45_ATTACKS[square][(occupied.l45 >> BB_SHIFT_L45[square]) & 127])
-        elif piece_type == ROOK:
-            return (BB_RANK_ATTACKS[square][(occupied.bits >> (((square // 9) * 9) + 1)) & 127] |
-                    BB_FILE_ATTACKS[square][(occupied.l90 >> (((square % 9) * 9) + 1)) & 127])
-        elif piece_type in [KING, PROM_SUI]:
-            return BB_KING_ATTACKS[square]
-        elif piece_type == PROM_BISHOP:
-            return (BB_KING_ATTACKS[square] |
-                    BB_R45_ATTACKS[square][(occupied.r45 >> BB_SHIFT_R45[square]) & 127] |
-                    BB_L45_ATTACKS[square][(occupied.l45 >> BB_SHIFT_L45[square]) & 127])
-        elif piece_type == PROM_ROOK:
-            return (BB_KING_ATTACKS[square] |
-                    BB_RANK_ATTACKS[square][(occupied.bits >> (((square // 9) * 9) + 1)) & 127] |
-                    BB_FILE_ATTACKS[square][(occupied.l90 >> (((square % 9) * 9) + 1)) & 127])
-        elif piece_type == SUI:
-            return BB_SUI_ATTACKS[move_color][square]
+        attacks = BB_STEP_ATTACKS[(piece_type * 2 + move_color) * 81 + square]
+        sliding_attacks = PIECE_SLIDING_ATTACKS[piece_type]
+        if sliding_attacks is not None:
+            attacks |= sliding_attacks(square, occupied, move_color)
+        return attacks
 
     def is_suicide_or_check_by_dropping_pawn(self, move):
         '''
@@ -846,32 +2178,24 @@ class Board(object):
         Checks if the king of the other side is attacked. Such a position is not
         valid and could only be reached by an illegal move.
         '''
-        return self.kings_living[self.turn ^ 1] == 1 and (self.is_attacked_by(self.turn,
-            self.king_squares[self.turn ^ 1]) or self.is_attacked_by(self.turn, self.promsui_squares[self.turn ^ 1]))
+        return self.is_attacked_by(self.turn, self.royal_square(self.turn ^ 1))
 
     def was_check_by_dropping_pawn(self, move):
-        # NOTE: We ignore the case "Saigo no shinpan" (by Koji Nuita, 1997)
-        # We don't use is_checkmate() because it's slow due to generating all leagl moves
-        # And we don't consider suicide of a king.
-
-        pawn_square = move.to_square
-
         # Pawn is dropped?
         if move.drop_piece_type != PAWN:
             return False
 
-        if self.kings_living[self.turn] > 1:
-            return False
-
-        king_square = self.king_squares[self.turn]
+        return self.was_check_by_dropping_pawn_at(move.to_square)
 
+    def was_check_by_dropping_pawn_at(self, pawn_square):
+        # NOTE: We ignore the case "Saigo no shinpan" (by Koji Nuita, 1997)
+        # We don't use is_checkmate() because it's slow due to generating all leagl moves
+        # And we don't consider suicide of a king.
 
-        # Does king exist?
+        # Does the only king exist?
+        king_square = self.royal_square(self.turn)
         if king_square is None:
-            if self.promsui_squares[self.turn] is None:
-                return False
-            else:
-                king_square = self.promsui_squares[self.turn]
+            return False
 
         # Pawn can capture a king next move?
         moves = BB_PAWN_ATTACKS[self.turn ^ 1][pawn_square] & ~self.occupied[self.turn ^ 1]
@@ -896,10 +2220,12 @@ class Board(object):
             rooks=True, king=True,
             pawns_drop=True, lances_drop=True, knights_drop=True, silvers_drop=True, golds_drop=True,
             bishops_drop=True, rooks_drop=True, sui=True,prom_sui=True):
-        return (move for move in self.generate_pseudo_legal_moves(
+        targets, drop_targets = self.evasion_targets()
+        return (MOVES_BY_INT[move_int] for move_int in self.filter_legal_move_ints(move.to_int() for move in
+            self.generate_pseudo_legal_moves(
                 pawns, lances, knights, silvers, golds, bishops, rooks, king,
                 pawns_drop, lances_drop, knights_drop, silvers_drop, golds_drop, bishops_drop, rooks_drop
-            , sui, prom_sui) if not self.is_suicide_or_check_by_dropping_pawn(move))
+            , sui, prom_sui, targets=targets, drop_targets=drop_targets)))
 
     def is_pseudo_legal(self, move):
         # Null moves are not pseudo legal.
@@ -970,9 +2296,9 @@ class Board(object):
         '''
 
         # Stalemate or checkmate.
-        try:
-            next(self.generate_legal_moves().__iter__())
-        except StopIteration:
+        for move_int in self.generate_legal_move_ints():
+            break
+        else:
             return True
 
         # Fourfold repetition.
@@ -986,22 +2312,18 @@ class Board(object):
         if not self.is_check():
             return False
 
-        try:
-            next(self.generate_legal_moves().__iter__())
+        for move_int in self.generate_evasion_move_ints():
             return False
-        except StopIteration:
-            return True
+        return True
 
     def is_stalemate(self):
         '''Checks if the current position is a stalemate.'''
         if self.is_check():
             return False
 
-        try:
-            next(self.generate_legal_moves().__iter__())
+        for move_int in self.filter_legal_move_ints(self.generate_pseudo_legal_move_ints()):
             return False
-        except StopIteration:
-            return True
+        return True
 
     def is_fourfold_repetition(self):
         '''
@@ -1017,6 +2339,64 @@ class Board(object):
 
         return True
 
+    def repetition(self, count=4):
+        '''
+        Classifies a repetition (sennichite) of the current position from
+        the view of the side to move. The positions 2, 4, 6, ... plies back
+        are compared with the current one, up to the last null move.
+        Returns `REPETITION_DRAW` if the position occurred `count` times,
+        or `REPETITION_WIN` (`REPETITION_LOSE`) if in addition every move of
+        the opponent (of the side to move) since the first of these
+        occurrences gave check. Otherwise returns `REPETITION_SUPERIOR`
+        (`REPETITION_INFERIOR`) if the same pieces were on the board with
+        fewer (more) pieces in hand of the side to move, or
+        `REPETITION_NONE`.
+        '''
+        states = self.states
+        zobrist_key = self.zobrist_key
+        board_key = self.incremental_zobrist_hash
+        hand = self.hands[self.turn]
+        occurrences = 1
+        hand_repetition = REPETITION_NONE
+
+        # states[i] holds the keys of the position before the i-th move.
+        i = len(states) - 2
+        while i >= 0:
+            if not states[i + 1].move_int or not states[i].move_int:
+                break
+            state = states[i]
+            if state.zobrist_key == zobrist_key:
+                occurrences += 1
+                if occurrences >= count:
+                    return self.classify_repetition(len(states) - i)
+            elif state.incremental_zobrist_hash == board_key and not hand_repetition:
+                if hand_is_superior(hand, state.hand):
+                    hand_repetition = REPETITION_SUPERIOR
+                elif hand_is_superior(state.hand, hand):
+                    hand_repetition = REPETITION_INFERIOR
+            i -= 2
+
+        return hand_repetition
+
+    def classify_repetition(self, plies):
+        '''
+        Tells if the last `plies` moves, which returned to the same position,
+        were all checks by one side. Returns `REPETITION_WIN`,
+        `REPETITION_LOSE` or `REPETITION_DRAW` for the side to move.
+        '''
+        board = self.copy(stack=plies)
+        checks = []
+        while board.states:
+            checks.append(board.is_check())
+            board.pop()
+
+        # The side to move was in check after every move of the opponent.
+        if all(checks[0::2]):
+            return REPETITION_WIN
+        if all(checks[1::2]):
+            return REPETITION_LOSE
+        return REPETITION_DRAW
+
     def is_double_pawn(self, to_square, piece_type):
         if piece_type != PAWN:
             return False
@@ -1025,6 +2405,7 @@ class Board(object):
     def push_usi_position_cmd(self, usi_position_cmd):
         '''
         Updates the position from position command in USI protocol.
+        Moves already on the move stack are kept, see `set_position()`.
 
         Example:
         >>> board.push_usi_position_cmd("position startpos moves 7g7f 3c3d")
@@ -1037,18 +2418,64 @@ class Board(object):
 
         if sfen_id != -1:
             if moves_id != -1:
-                sfen = usi_position_cmd[sfen_id+5:moves_id]
+                sfen = usi_position_cmd[sfen_id+5:moves_id].strip()
             else:
-                sfen = usi_position_cmd[sfen_id+5:]
-            self.set_sfen(sfen)
+                sfen = usi_position_cmd[sfen_id+5:].strip()
         else:
-            self.reset()
+            sfen = STARTING_SFEN
 
         if moves_id != -1:
-            moves = usi_position_cmd[moves_id+6:].split(" ")
-            for move in moves:
-                if move != "":
-                    self.push_usi(move)
+            moves = usi_position_cmd[moves_id+6:].split()
+        else:
+            moves = []
+
+        self.set_position(sfen, moves)
+
+    def position_key(self, move_number=None):
+        '''
+        Returns the pieces, hands, turn and move number of the current
+        position as a tuple that compares equal for equal positions.
+        '''
+        occupied_by_color = self.occupied.by_color
+        return (tuple(self.pieces), occupied_by_color[BLACK], occupied_by_color[WHITE], tuple(self.hands),
+                self.turn, self.move_number if move_number is None else move_number)
+
+    def set_position(self, sfen, usi_moves):
+        '''
+        Sets the position reached by a list of moves given in USI notation
+        from the position given as SFEN. If the board started from the same
+        position, only the moves after the longest common prefix with the
+        move stack are popped and pushed instead of replaying all of them.
+        Returns the number of moves kept from the move stack.
+        '''
+        decoded = decode_sfen(sfen)
+        states = self.states
+        if states:
+            root_key = states[0].zobrist_key
+            root_position = self.root_position
+        else:
+            root_key = self.zobrist_key
+            root_position = self.position_key()
+
+        # Zobrist keys can collide, so equal keys are confirmed on the board.
+        if root_key != decoded[10] or root_position != (decoded[1], decoded[2].by_color[BLACK],
+                                                        decoded[2].by_color[WHITE], decoded[3],
+                                                        decoded[7], decoded[8]):
+            self.set_sfen(sfen)
+            common = 0
+        else:
+            common = 0
+            for state, usi in zip(states, usi_moves):
+                if state.move.usi() != usi:
+                    break
+                common += 1
+            while len(states) > common:
+                self.pop()
+
+        for usi in usi_moves[common:]:
+            self.push_usi(usi)
+
+        return common
 
     def push(self, move):
         '''
@@ -1061,255 +2488,262 @@ class Board(object):
         >>> move in board.pseudo_legal_moves
         True
         '''
+        self.push_int(move.to_int(), move)
+
+    def push_int(self, move_int, move=None):
+        '''
+        Updates the position with a move packed into an integer (see
+        `Move.to_int()`). The move put onto the move stack is `move`, or
+        the shared move for `move_int` if it is not given.
+        '''
+        if move is None:
+            move = MOVES_BY_INT[move_int]
+
         # Increment move number.
         self.move_number += 1
 
-        # Remember game state.
-        captured_piece = self.piece_type_at(move.to_square) if move else NONE
-        self.captured_piece_stack.append(captured_piece)
-        self.move_stack.append(move)
+        # Remember game state, and the position the move stack starts from.
+        to_square = move_int & 127
+        captured_piece_type = self.pieces[to_square] if move_int else NONE
+        if not self.states:
+            self.root_position = self.position_key(self.move_number - 1)
+        self.states.append(StateInfo(move, move_int, captured_piece_type, self.hands[self.turn],
+                                     self.zobrist_key, self.incremental_zobrist_hash, self.zobrist_key_high))
 
         # On a null move simply swap turns.
-        if not move:
+        if not move_int:
             self.turn ^= 1
+            self.zobrist_key ^= ZOBRIST_TURN_KEY
+            if self.zobrist_key_high is not None:
+                self.zobrist_key_high ^= ZOBRIST_HIGH_TURN_KEY
             return
 
-        if move.drop_piece_type:
+        from_square = (move_int >> 7) & 127
+        if from_square >= 81:
             # Drops.
-            piece_type = move.drop_piece_type
+            piece_type = from_square - 81
             from_hand = True
         else:
             # Promotion.
-            piece_type = self.piece_type_at(move.from_square)
+            piece_type = self.pieces[from_square]
             from_hand = False
 
-            if move.promotion:
+            if move_int >> 14:
                 piece_type = PIECE_PROMOTED[piece_type]
 
             # Remove piece from target square.
-            self.remove_piece_at(move.from_square, False)
+            self.remove_piece_at(from_square, False)
 
         # Put piece on target square.
-        self.set_piece_at(move.to_square, Piece(piece_type, self.turn), from_hand, True)
+        self.set_piece_type_at(to_square, piece_type, self.turn, from_hand, True)
 
         # Swap turn.
         self.turn ^= 1
+        self.zobrist_key ^= ZOBRIST_TURN_KEY
+        if self.zobrist_key_high is not None:
+            self.zobrist_key_high ^= ZOBRIST_HIGH_TURN_KEY
 
         # Update transposition table.
-        self.transpositions.update((self.zobrist_hash(), ))
+        self.transpositions[self.zobrist_hash()] += 1
 
     def pop(self):
         '''
         Restores the previous position and returns the last move from the stack.
         '''
-        move = self.move_stack.pop()
+        state = self.states.pop()
+        move_int = state.move_int
 
         # Update transposition table.
-        self.transpositions.subtract((self.zobrist_hash(), ))
+        if move_int:
+            zobrist_hash = self.zobrist_hash()
+            count = self.transpositions[zobrist_hash] - 1
+            if count:
+                self.transpositions[zobrist_hash] = count
+            else:
+                del self.transpositions[zobrist_hash]
 
-        # Decrement move number.
+        # Decrement move number and swap the turn back to the side that moved.
         self.move_number -= 1
+        self.turn ^= 1
 
-        # Restore state.
-        captured_piece_type = self.captured_piece_stack.pop()
-        captured_piece_color = self.turn
-
-        # On a null move simply swap the turn.
-        if not move:
-            self.turn ^= 1
-            return move
-
-        # Restore the source square.
-        piece_type = self.piece_type_at(move.to_square)
-        if move.promotion:
-            piece_type = PIECE_PROMOTED.index(piece_type)
-
-        if move.from_square is None:
-            self.add_piece_into_hand(piece_type, self.turn ^ 1)
-        else:
-            self.set_piece_at(move.from_square, Piece(piece_type, self.turn ^ 1))
-
-        # Restore target square.
-        if captured_piece_type:
-            self.remove_piece_from_hand(captured_piece_type, captured_piece_color ^ 1)
-            self.set_piece_at(move.to_square, Piece(captured_piece_type, captured_piece_color))
-        else:
-            self.remove_piece_at(move.to_square)
+        if move_int:
+            turn = self.turn
+            to_square = move_int & 127
+            from_square = (move_int >> 7) & 127
+            piece_type = self.pieces[to_square]
+            captured_piece_type = state.captured_piece_type
+            if move_int >> 14:
+                unpromoted_piece_type = PIECE_UNPROMOTED[piece_type]
+            else:
+                unpromoted_piece_type = piece_type
+
+            if self.attack_maps is not None:
+                # Let the attack maps follow the pieces.
+                if from_square < 81:
+                    self.set_piece_type_at(from_square, unpromoted_piece_type, turn)
+                if captured_piece_type:
+                    self.set_piece_type_at(to_square, captured_piece_type, turn ^ 1)
+                else:
+                    self.remove_piece_at(to_square)
+            else:
+                pieces = self.pieces
+                piece_bb = self.piece_bb
+                occupied = self.occupied
+                kings_living = self.kings_living
+
+                # Restore the target square.
+                to_mask = BB_SQUARES[to_square]
+                pieces[to_square] = captured_piece_type
+                self.sfen_ranks[to_square // 9] = None
+                piece_bb[piece_type] ^= to_mask
+                if piece_type == KING or piece_type == PROM_SUI:
+                    kings_living[turn] -= 1
+                if captured_piece_type:
+                    piece_bb[captured_piece_type] ^= to_mask
+                    occupied.by_color[turn] ^= to_mask
+                    occupied.by_color[turn ^ 1] ^= to_mask
+                    if captured_piece_type == KING:
+                        self.king_squares[turn ^ 1] = to_square
+                        kings_living[turn ^ 1] += 1
+                    elif captured_piece_type == PROM_SUI:
+                        self.promsui_squares[turn ^ 1] = to_square
+                        kings_living[turn ^ 1] += 1
+                else:
+                    occupied.ixor(to_mask, turn, to_square)
+
+                # Restore the source square.
+                if from_square < 81:
+                    from_mask = BB_SQUARES[from_square]
+                    pieces[from_square] = unpromoted_piece_type
+                    self.sfen_ranks[from_square // 9] = None
+                    piece_bb[unpromoted_piece_type] ^= from_mask
+                    occupied.ixor(from_mask, turn, from_square)
+                    if unpromoted_piece_type == KING:
+                        self.king_squares[turn] = from_square
+                        kings_living[turn] += 1
+                    elif unpromoted_piece_type == PROM_SUI:
+                        self.promsui_squares[turn] = from_square
+                        kings_living[turn] += 1
+
+            if self.hands[turn] != state.hand:
+                self.hands[turn] = state.hand
+                self.sfen_hand = None
+            self.incremental_zobrist_hash = state.incremental_zobrist_hash
+
+        self.zobrist_key = state.zobrist_key
+        if self.zobrist_key_high is not None:
+            if state.zobrist_key_high is None:
+                # The second key was enabled after the move.
+                self.zobrist_key_high = self.compute_zobrist_hash_high()
+            else:
+                self.zobrist_key_high = state.zobrist_key_high
 
-        # Swap turn.
-        self.turn ^= 1
+        return state.move
 
-        return move
+    def pop_int(self):
+        '''
+        Restores the previous position and returns the last move packed into
+        an integer.
+        '''
+        move_int = self.states[-1].move_int
+        self.pop()
+        return move_int
 
     def peek(self):
         '''Gets the last move from the move stack.'''
-        return self.move_stack[-1]
+        return self.states[-1].move
 
     def sfen(self):
         '''
         Gets an SFEN representation of the current position.
+        The rows and the hands are cached until pieces on them change, and
+        the SFENs of recent positions are remembered by Zobrist key.
         '''
-        sfen = []
+        parts = self.sfen_memo.get(self.zobrist_key)
+        if parts is None:
+            ranks = self.sfen_ranks
+            for rank in range(9):
+                if ranks[rank] is None:
+                    ranks[rank] = self.sfen_rank(rank)
+            if self.sfen_hand is None:
+                self.sfen_hand = self.sfen_pieces_in_hand()
+
+            if len(self.sfen_memo) >= SFEN_MEMO_SIZE:
+                self.sfen_memo.clear()
+            parts = self.sfen_memo[self.zobrist_key] = ('/'.join(ranks), self.sfen_hand)
+
+        return '{0} {1} {2} {3}'.format(parts[0], 'w' if self.turn == WHITE else 'b', parts[1], self.move_number)
+
+    def sfen_rank(self, rank):
+        '''Gets the SFEN of one row of the board, from file 9 to file 1.'''
+        occupied_by_white = self.occupied.by_color[WHITE]
+        pieces = self.pieces
+        fragment = []
         empty = 0
 
-        # Position part.
-        for square in SQUARES:
-            piece = self.piece_at(square)
-
-            if not piece:
+        for square in range(rank * 9, rank * 9 + 9):
+            piece_type = pieces[square]
+            if not piece_type:
                 empty += 1
-            else:
-                if empty:
-                    sfen.append(str(empty))
-                    empty = 0
-                sfen.append(piece.symbol())
+                continue
+            if empty:
+                fragment.append(str(empty))
+                empty = 0
+            fragment.append(SFEN_SYMBOLS[(occupied_by_white >> square) & 1][piece_type])
 
-            if BB_SQUARES[square] & BB_FILE_1:
-                if empty:
-                    sfen.append(str(empty))
-                    empty = 0
+        if empty:
+            fragment.append(str(empty))
 
-                if square != I1:
-                    sfen.append('/')
-
-        sfen.append(' ')
-
-        # Side to move.
-        if self.turn == WHITE:
-            sfen.append('w')
-        else:
-            sfen.append('b')
+        return ''.join(fragment)
 
-        sfen.append(' ')
+    def sfen_pieces_in_hand(self):
+        '''Gets the pieces in hand part of the SFEN.'''
+        if not (self.hands[BLACK] or self.hands[WHITE]):
+            return '-'
 
-        # Pieces in hand
-        pih_len = 0
+        sfen = []
         for color in COLORS:
-            p = self.pieces_in_hand[color]
-            pih_len += len(p)
-            for piece_type in sorted(p.keys(), reverse=True):
-                if p[piece_type] >= 1:
-                    if p[piece_type] > 1:
-                        sfen.append(str(p[piece_type]))
-                    piece = Piece(piece_type, color)
-                    sfen.append(piece.symbol())
-        if pih_len == 0:
-            sfen.append('-')
-
-        sfen.append(' ')
-
-        # Move count
-        sfen.append(str(self.move_number))
+            hand = self.hands[color]
+            for piece_type in range(ROOK, NONE, -1):
+                count = (hand >> HAND_SHIFTS[piece_type]) & HAND_COUNT_MAX
+                if count:
+                    if count > 1:
+                        sfen.append(str(count))
+                    sfen.append(SFEN_SYMBOLS[color][piece_type])
 
         return ''.join(sfen)
 
-    def set_sfen(self, sfen):
+    def set_sfen(self, sfen, validate=True):
         '''
         Parses a SFEN and sets the position from it.
-        Rasies `ValueError` if the SFEN string is invalid.
+        Rasies `ValueError` if the SFEN string is invalid. With
+        `validate=False` the SFEN is trusted to be well formed.
+        Recently parsed SFENs are copied from a cache, see
+        `set_sfen_cache_size()`.
         '''
-        # Ensure there are six parts.
-        parts = sfen.split()
-        if len(parts) != 4:
-            raise ValueError('sfen string should consist of 6 parts: {0}'.format(repr(sfen)))
-
-        # Ensure the board part is valid.
-        rows = parts[0].split('/')
-        if len(rows) != 9:
-            raise ValueError('expected 9 rows in position part of sfen: {0}'.format(repr(sfen)))
-
-        # Validate each row.
-        for row in rows:
-            field_sum = 0
-            previous_was_digit = False
-            previous_was_plus = False
-
-            for c in row:
-                if c in ['1', '2', '3', '4', '5', '6', '7', '8', '9']:
-                    if previous_was_digit:
-                        raise ValueError('two subsequent digits in position part of sfen: {0}'.format(repr(sfen)))
-                    if previous_was_plus:
-                        raise ValueError('Cannot promote squares in position part of sfen: {0}'.format(repr(sfen)))
-                    field_sum += int(c)
-                    previous_was_digit = True
-                    previous_was_plus = False
-                elif c == '+':
-                    if previous_was_plus:
-                        raise ValueError('Double promotion prefixes in position part of sfen: {0}'.format(repr(sfen)))
-                    previous_was_digit = False
-                    previous_was_plus = True
-                elif c.lower() in ['p', 'l', 'n', 's', 'g', 'b', 'r', 'k', 'z']:
-                    field_sum += 1
-                    if previous_was_plus and (c.lower() == 'g' or c.lower() == 'k'):
-                      raise ValueError('Gold and King cannot promote in position part of sfen: {0}')
-                    previous_was_digit = False
-                    previous_was_plus = False
-                else:
-                    raise ValueError('invalid character in position part of sfen: {0}'.format(repr(sfen)))
-
-            if field_sum != 9:
-                raise ValueError('expected 9 columns per row in position part of sfen: {0}'.format(repr(sfen)))
-
-        # Check that the turn part is valid.
-        if not parts[1] in ['b', 'w']:
-            raise ValueError("expected 'b' or 'w' for turn part of sfen: {0}".format(repr(sfen)))
-
-        # Check pieces in hand is valid.
-        # TODO: implement with checking parts[2]
-
-        # Check that the fullmove number part is valid.
-        # 0 is allowed for compability but later replaced with 1.
-        if int(parts[3]) < 0:
-            raise ValueError('fullmove number must be positive: {0}'.format(repr(sfen)))
-
-        # Clear board.
-        self.clear()
-
-        # Put pieces on the board.
-        square_index = 0
-        previous_was_plus = False
-        for c in parts[0]:
-            if c in ['1', '2', '3', '4', '5', '6', '7', '8', '9']:
-                square_index += int(c)
-            elif c == '+':
-                previous_was_plus = True
-            elif c == '/':
-                pass
-            else:
-                piece_symbol = c
-                if previous_was_plus:
-                  piece_symbol = '+' + piece_symbol
-                self.set_piece_at(square_index, Piece.from_symbol(piece_symbol))
-                square_index += 1
-                previous_was_plus = False
-
-        # Set the turn.
-        if parts[1] == 'w':
-            self.turn = WHITE
-        else:
-            self.turn = BLACK
-
-        # Set the pieces in hand
-        self.pieces_in_hand = [collections.Counter(), collections.Counter()]
-        if parts[2] != '-':
-            piece_count = 0
-            for c in parts[2]:
-                if c in ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']:
-                    piece_count *= 10
-                    piece_count += int(c)
-                else:
-                    piece = Piece.from_symbol(c)
-                    if piece_count == 0:
-                        piece_count = 1
-                    self.add_piece_into_hand(piece.piece_type, piece.color, piece_count)
-                    piece_count = 0
-
-        # Set the mover counters.
-        self.move_number = int(parts[3]) or 1
+        (piece_bb, pieces, occupied, hands, king_squares, promsui_squares, kings_living,
+         self.turn, self.move_number, self.incremental_zobrist_hash, self.zobrist_key) = decode_sfen(sfen, validate)
+
+        self.piece_bb = list(piece_bb)
+        self.pieces = list(pieces)
+        self.occupied = occupied.copy()
+        self.hands = list(hands)
+        self.king_squares = list(king_squares)
+        self.promsui_squares = list(promsui_squares)
+        self.kings_living = list(kings_living)
+        self.sfen_ranks = [None for rank in range(9)]
+        self.sfen_hand = None
+        self.states = []
+        self.root_position = None
 
         # Reset the transposition table.
+        if self.zobrist_key_high is not None:
+            self.zobrist_key_high = self.compute_zobrist_hash_high()
         self.transpositions = collections.Counter((self.zobrist_hash(), ))
 
+        if self.track_attacks:
+            self.update_attack_maps()
+
     def push_usi(self, usi):
         '''
         Parses a move in standard coordinate notation, makes the move and puts
@@ -1321,6 +2755,124 @@ class Board(object):
         self.push(move)
         return move
 
+    def replay(self, moves, trusted=True, keep_history=True):
+        '''
+        Makes a sequence of moves given as USI strings, packed integers or
+        `Move` objects and returns the board.
+        Unless `trusted`, raises `ValueError` at the first illegal move, with
+        the moves before it made. Without `keep_history` the moves are not
+        put onto the move stack: pieces are moved on the bitboards only and
+        hashes, repetition counts and attack maps are computed once at the
+        end, which is much faster for long games. The board then has no
+        move history at all, so this raises `ValueError` if the move stack
+        is not empty.
+        '''
+        if not keep_history and self.states:
+            raise ValueError('replay without history needs an empty move stack, '
+                             'it would drop the {0} moves on it'.format(len(self.states)))
+
+        if not trusted or keep_history:
+            try:
+                for move in moves:
+                    if isinstance(move, numbers.Integral):
+                        move_int = int(move)
+                        move = None
+                    else:
+                        if not isinstance(move, Move):
+                            move = Move.from_usi(move)
+                        move_int = move.to_int()
+                    if not trusted and move_int not in self.generate_legal_move_ints():
+                        raise ValueError('illegal move {0} in {1}'.format(Move.from_int(move_int).usi(), self.sfen()))
+                    self.push_int(move_int, move)
+            finally:
+                if not keep_history:
+                    self.states = []
+                    self.transpositions = collections.Counter((self.zobrist_hash(), ))
+            return self
+
+        pieces = self.pieces
+        piece_bb = self.piece_bb
+        occupied_by_color = self.occupied.by_color
+        occupied = self.occupied.bits
+        hands = self.hands
+        kings_living = self.kings_living
+        turn = self.turn
+        plies = 0
+
+        for move in moves:
+            if isinstance(move, numbers.Integral):
+                move_int = int(move)
+            elif isinstance(move, Move):
+                move_int = move.to_int()
+            else:
+                move_int = Move.from_usi(move).to_int()
+            plies += 1
+            if not move_int:
+                turn ^= 1
+                continue
+
+            to_square = move_int & 127
+            from_square = (move_int >> 7) & 127
+            to_mask = BB_SQUARES[to_square]
+
+            if from_square >= 81:
+                piece_type = from_square - 81
+                hands[turn] -= 1 << HAND_SHIFTS[piece_type]
+            else:
+                from_mask = BB_SQUARES[from_square]
+                piece_type = pieces[from_square]
+                pieces[from_square] = NONE
+                piece_bb[piece_type] ^= from_mask
+                occupied_by_color[turn] ^= from_mask
+                occupied ^= from_mask
+                if piece_type == KING or piece_type == PROM_SUI:
+                    kings_living[turn] -= 1
+                if move_int >> 14:
+                    piece_type = PIECE_PROMOTED[piece_type]
+
+            captured_piece_type = pieces[to_square]
+            if captured_piece_type:
+                piece_bb[captured_piece_type] ^= to_mask
+                occupied_by_color[turn ^ 1] ^= to_mask
+                if captured_piece_type == KING or captured_piece_type == PROM_SUI:
+                    kings_living[turn ^ 1] -= 1
+                elif captured_piece_type != SUI:
+                    hands[turn] += 1 << HAND_SHIFTS[PIECE_UNPROMOTED[captured_piece_type]]
+            else:
+                occupied ^= to_mask
+
+            pieces[to_square] = piece_type
+            piece_bb[piece_type] |= to_mask
+            occupied_by_color[turn] |= to_mask
+            if piece_type == KING:
+                self.king_squares[turn] = to_square
+                kings_living[turn] += 1
+            elif piece_type == PROM_SUI:
+                self.promsui_squares[turn] = to_square
+                kings_living[turn] += 1
+
+            turn ^= 1
+
+        self.occupied.bits = occupied
+        if self.occupied.rotated:
+            self.occupied.update_rotated()
+        self.turn = turn
+        self.move_number += plies
+        self.sfen_ranks = [None for rank in range(9)]
+        self.sfen_hand = None
+
+        # Compute what push_int() would have kept up to date.
+        self.incremental_zobrist_hash = self.board_zobrist_hash(DEFAULT_RANDOM_ARRAY)
+        self.zobrist_key = self.compute_zobrist_hash()
+        if self.zobrist_key_high is not None:
+            self.zobrist_key_high = self.compute_zobrist_hash_high()
+        self.states = []
+        self.transpositions = collections.Counter((self.zobrist_key, ))
+        if self.attack_maps is not None:
+            self.update_attack_maps()
+
+        return self
+
     def kif_pieces_in_hand_str(self, color):
         builder = [[
             '先手の持駒：',
@@ -1329,11 +2881,10 @@ class Board(object):
 
         for piece_type in range(ROOK, NONE, -1):
             if self.has_piece_in_hand(piece_type, color):
-                piece_count = self.pieces_in_hand[color][piece_type]
+                piece_count = hand_count(self.hands[color], piece_type)
                 if piece_count:
                     builder.append('　')
-                    piece = Piece(piece_type, color)
-                    builder.append(piece.japanese_symbol())
+                    builder.append(PIECES[color][piece_type].japanese_symbol())
                     if piece_count > 1:
                         builder.append(NUMBER_JAPANESE_KANJI_SYMBOLS[piece_count])
 
@@ -1395,15 +2946,14 @@ class Board(object):
             else:
                 builder.append(' ')
 
-        if len(self.pieces_in_hand[BLACK]) + len(self.pieces_in_hand[WHITE]) > 0:
+        if self.hands[BLACK] or self.hands[WHITE]:
             builder.append('\n\n')
 
             # pieces in hand
             for color in COLORS:
                 for piece_type, piece_count in self.pieces_in_hand[color].items():
                     builder.append(' ')
-                    piece = Piece(piece_type, color)
-                    builder.append(piece.symbol())
+                    builder.append(PIECES[color][piece_type].symbol())
                     builder.append('*')
                     builder.append(str(piece_count))
 
@@ -1418,7 +2968,7 @@ class Board(object):
                 return True
             if self.piece_bb != board.piece_bb:
                 return True
-            if self.pieces_in_hand != board.pieces_in_hand:
+            if self.hands != board.hands:
                 return True
             if self.turn != board.turn:
                 return True
@@ -1432,13 +2982,27 @@ class Board(object):
     def zobrist_hash(self, array=None):
         '''
         Returns a Zobrist hash of the current position.
+        Without `array` this is the incrementally maintained key of the board,
+        the side to move and both hands (see `compute_zobrist_hash()`). If
+        `check_zobrist` is set it is checked against a key computed from
+        scratch.
+        Passing `array` is deprecated: it computes the former key, which
+        takes the turn key and the black hand from `array`, from scratch.
+        That key is not comparable to the one without `array`, even for
+        `DEFAULT_RANDOM_ARRAY`.
         '''
+        if array is None:
+            if self.check_zobrist and (self.zobrist_key != self.compute_zobrist_hash() or (
+                    self.zobrist_key_high is not None and self.zobrist_key_high != self.compute_zobrist_hash_high())):
+                raise AssertionError('incremental zobrist hash is out of sync: {0}'.format(self.sfen()))
+            return self.zobrist_key
+
+        warnings.warn('zobrist_hash(array) is deprecated and not comparable to zobrist_hash()',
+                      DeprecationWarning, stacklevel=2)
+
         # Hash in the board setup.
         zobrist_hash = self.board_zobrist_hash(array)
 
-        if array is None:
-            array = DEFAULT_RANDOM_ARRAY
-
         if self.turn == WHITE:
             zobrist_hash ^= array[2268 + 81 * 2]
 
@@ -1460,6 +3024,69 @@ class Board(object):
 
         return zobrist_hash
 
+    def compute_zobrist_hash(self):
+        '''
+        Computes the key returned by `zobrist_hash()` from scratch.
+        '''
+        zobrist_hash = self.board_zobrist_hash(DEFAULT_RANDOM_ARRAY)
+
+        if self.turn == WHITE:
+            zobrist_hash ^= ZOBRIST_TURN_KEY
+
+        for color in COLORS:
+            hand = self.hands[color]
+            for piece_type in HAND_PIECE_TYPES:
+                zobrist_hash ^= ZOBRIST_HAND_KEYS[(color * 8 + piece_type) * (HAND_COUNT_MAX + 1) +
+                                                  ((hand >> HAND_SHIFTS[piece_type]) & HAND_COUNT_MAX)]
+
+        return zobrist_hash
+
+    def enable_wide_zobrist(self):
+        '''Starts maintaining the second key of `zobrist_hash128()`.'''
+        self.zobrist_key_high = self.compute_zobrist_hash_high()
+
+    def disable_wide_zobrist(self):
+        '''Stops maintaining the second key of `zobrist_hash128()`.'''
+        self.zobrist_key_high = None
+
+    def compute_zobrist_hash_high(self):
+        '''
+        Computes the second key of `zobrist_hash128()` from scratch.
+        '''
+        zobrist_hash = 0
+
+        for color in COLORS:
+            squares = self.occupied.by_color[color]
+            while squares:
+                mask = squares & -squares
+                squares ^= mask
+                square = mask.bit_length() - 1
+                zobrist_hash ^= ZOBRIST_HIGH_PIECE_KEYS[81 * ((self.pieces[square] - 1) * 2 + color) + square]
+
+            hand = self.hands[color]
+            for piece_type in HAND_PIECE_TYPES:
+                zobrist_hash ^= ZOBRIST_HIGH_HAND_KEYS[(color * 8 + piece_type) * (HAND_COUNT_MAX + 1) +
+                                                       ((hand >> HAND_SHIFTS[piece_type]) & HAND_COUNT_MAX)]
+
+        if self.turn == WHITE:
+            zobrist_hash ^= ZOBRIST_HIGH_TURN_KEY
+
+        return zobrist_hash
+
+    def zobrist_hash128(self):
+        '''
+        Returns a 128 bit Zobrist hash of the current position for large
+        position databases. The low 64 bits are `zobrist_hash()`, the high
+        ones an independent key. It is read from the board if
+        `wide_zobrist` is enabled and computed from scratch otherwise.
+        '''
+        zobrist_key_high = self.zobrist_key_high
+        if zobrist_key_high is None:
+            zobrist_key_high = self.compute_zobrist_hash_high()
+        elif self.check_zobrist and zobrist_key_high != self.compute_zobrist_hash_high():
+            raise AssertionError('incremental zobrist hash is out of sync: {0}'.format(self.sfen()))
+        return zobrist_key_high << 64 | self.zobrist_hash()
+
     def board_zobrist_hash(self, array=None):
         if array is None:
             return self.incremental_zobrist_hash
@@ -1497,9 +3124,8 @@ class PseudoLegalMoveGenerator(object):
 
     __nonzero__ = __bool__
 
-    # TODO: Counting without generating actual moves
     def __len__(self):
-        return sum(1 for _ in self)
+        return self.board.count_pseudo_legal_moves()
 
     def __iter__(self):
         return self.board.generate_pseudo_legal_moves()
@@ -1514,21 +3140,14 @@ class LegalMoveGenerator(object):
         self.board = board
 
     def __bool__(self):
-        try:
-            next(self.board.generate_legal_moves())
+        for move_int in self.board.generate_legal_move_ints():
             return True
-        except StopIteration:
-            return False
+        return False
 
     __nonzero__ = __bool__
 
     def __len__(self):
-        count = 0
-
-        for move in self.board.generate_legal_moves():
-            count += 1
-
-        return count
+        return self.board.count_legal_moves()
 
     def __iter__(self):
         return self.board.generate_legal_moves()
@@ -5593,3 +7212,31 @@ DEFAULT_RANDOM_ARRAY = [
 0x8C729CB915915345,
 0xDDA1462C3585913B,
 ]
+
+def splitmix64(x):
+    '''
+    Mixes a 64 bit integer into a pseudo random one (the SplitMix64
+    generator step).
+    '''
+    x = (x + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return x ^ (x >> 31)
+
+# Keys of the incrementally maintained Zobrist hash besides the piece keys
+# in DEFAULT_RANDOM_ARRAY: the side to move and one key per side, piece type
+# and count of pieces in hand, indexed by
+# (color * 8 + piece_type) * (HAND_COUNT_MAX + 1) + count. No pieces in
+# hand have key 0.
+ZOBRIST_TURN_KEY = splitmix64(len(DEFAULT_RANDOM_ARRAY))
+ZOBRIST_HAND_KEYS = [
+    splitmix64(len(DEFAULT_RANDOM_ARRAY) + 1 + i) if i % (HAND_COUNT_MAX + 1) else 0
+    for i in range(2 * 8 * (HAND_COUNT_MAX + 1))]
+
+# Keys of the second, independent half of the 128 bit Zobrist hash, laid out
+# like DEFAULT_RANDOM_ARRAY (pieces), ZOBRIST_TURN_KEY and ZOBRIST_HAND_KEYS.
+ZOBRIST_HIGH_PIECE_KEYS = [splitmix64(0x5348 << 32 | i) for i in range(81 * 32)]
+ZOBRIST_HIGH_TURN_KEY = splitmix64(0x5348 << 32 | 81 * 32)
+ZOBRIST_HIGH_HAND_KEYS = [
+    splitmix64(0x5348 << 32 | 81 * 32 + 1 + i) if i % (HAND_COUNT_MAX + 1) else 0
+    for i in range(2 * 8 * (HAND_COUNT_MAX + 1))]
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the python-shogi library.
+# Copyright (C) 2015- Tasuku SUENAGA <tasuku-s-github@titech.ac>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# A binary file of game records, all numbers little endian:
+#
+#   header    magic 'SHGA', version, game, SFEN and name counts and the
+#             offsets of the index and of the SFEN and name tables
+#   games     per game: SFEN id, name ids of black and white (NO_NAME if
+#             missing), move count, result code and flags, then the packed
+#             moves as uint16 and, with FLAG_TIMES, the seconds per move as
+#             uint32 after padding to 4 bytes
+#   index     the offset of each game as uint64
+#   tables    count + 1 uint64 offsets followed by the UTF-8 strings
+#
+# Usage: python -m shogi.archive <archive> <kif or csa files...>
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import sys
+import mmap
+import struct
+import argparse
+from array import array
+from shogi import CSA
+from shogi.record import GameRecord, MOVE_TYPECODE, TIME_TYPECODE
+
+MAGIC = b'SHGA'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHHIIIQQQ')
+GAME_HEADER = struct.Struct('<IIIIBB2x')
+OFFSET = struct.Struct('<Q')
+
+NO_NAME = 0xffffffff
+FLAG_TIMES = 1
+
+# Results by code.
+RESULTS = [None, 'b', 'w', '-']
+
+# Arrays are viewed in place where memoryview can cast (Python 3) and the
+# host is little endian, and copied otherwise.
+ZERO_COPY = hasattr(memoryview, 'cast') and sys.byteorder == 'little'
+
+class ArchiveError(Exception):
+    pass
+
+def little_endian_bytes(typecode, values):
+    values = array(typecode, values)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tobytes() if hasattr(values, 'tobytes') else values.tostring()
+
+def release(values):
+    if isinstance(values, memoryview):
+        values.release()
+
+class StringTable(object):
+    def __init__(self):
+        self.strings = []
+        self.ids = {}
+
+    def id(self, string):
+        id = self.ids.get(string)
+        if id is None:
+            id = len(self.strings)
+            self.strings.append(string)
+            self.ids[string] = id
+        return id
+
+    def write(self, f):
+        encoded = [string.encode('utf-8') for string in self.strings]
+        offsets = [0]
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        f.write(struct.pack('<{0}Q'.format(len(offsets)), *offsets))
+        for data in encoded:
+            f.write(data)
+
+def read_string_table(buffer, offset, count):
+    size = OFFSET.size * (count + 1)
+    if offset + size > len(buffer):
+        raise ArchiveError('String table out of bounds')
+    offsets = struct.unpack_from('<{0}Q'.format(count + 1), buffer, offset)
+    start = offset + size
+    if offsets[0] != 0 or start + offsets[-1] > len(buffer) or \
+            any(offsets[i] > offsets[i + 1] for i in range(count)):
+        raise ArchiveError('Invalid string table offsets')
+    try:
+        return [bytes(buffer[start + offsets[i]:start + offsets[i + 1]]).decode('utf-8') for i in range(count)]
+    except UnicodeDecodeError:
+        raise ArchiveError('Invalid string in string table')
+
+def times_offset(offset, move_count):
+    # Times are aligned to 4 bytes after the moves.
+    offset += 2 * move_count
+    return offset + (-offset % 4)
+
+class ArchiveWriter(object):
+    '''
+    Writes game records to a seekable binary file opened for writing.
+    The index and tables are written by `close()`.
+    '''
+
+    def __init__(self, f):
+        self.f = f
+        self.offsets = []
+        self.sfens = StringTable()
+        self.names = StringTable()
+        self.f.write(b'\0' * HEADER.size)
+
+    def add(self, record):
+        '''Appends a `GameRecord`.'''
+        names = [NO_NAME if name is None else self.names.id(name) for name in record.names]
+        flags = FLAG_TIMES if record.times is not None else 0
+        if record.times is not None and len(record.times) != len(record):
+            raise ArchiveError('Expected a time for each of the {0} moves'.format(len(record)))
+
+        self.offsets.append(self.f.tell())
+        self.f.write(GAME_HEADER.pack(self.sfens.id(record.sfen), names[0], names[1], len(record),
+                                      RESULTS.index(record.win), flags))
+        self.f.write(little_endian_bytes(MOVE_TYPECODE, record.move_ints))
+        if flags & FLAG_TIMES:
+            self.f.write(b'\0' * (-self.f.tell() % 4))
+            self.f.write(little_endian_bytes(TIME_TYPECODE, record.times))
+
+    def close(self):
+        index_offset = self.f.tell()
+        for offset in self.offsets:
+            self.f.write(OFFSET.pack(offset))
+        sfen_table_offset = self.f.tell()
+        self.sfens.write(self.f)
+        name_table_offset = self.f.tell()
+        self.names.write(self.f)
+
+        self.f.seek(0)
+        self.f.write(HEADER.pack(MAGIC, VERSION, 0, len(self.offsets), len(self.sfens.strings),
+                                 len(self.names.strings), index_offset, sfen_table_offset, name_table_offset))
+        self.f.seek(0, 2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Without the index and the header the file is not a valid archive,
+        # so failed writes can not be mistaken for complete ones.
+        if exc_type is None:
+            self.close()
+
+def write(path, records):
+    '''Writes game records into a new archive file.'''
+    with open(path, 'wb') as f:
+        with ArchiveWriter(f) as writer:
+            for record in records:
+                writer.add(record)
+
+class Archive(object):
+    '''
+    An archive file mapped into memory. Games are looked up through the
+    offset index in constant time, and `moves()` and `iter_moves()` give
+    the packed moves of the games without copying them (see `ZERO_COPY`,
+    otherwise they are arrays). Views returned by `moves()` and `times()`
+    must be released before `close()`.
+    Raises `ArchiveError` if the file is not a valid archive.
+    '''
+
+    def __init__(self, path):
+        self.buffer = None
+        self.view = None
+        self.f = open(path, 'rb')
+        try:
+            try:
+                self.buffer = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can not be mapped.
+                raise ArchiveError('Not an archive: {0}'.format(path))
+            self.read_header(path)
+        except:
+            self.close()
+            raise
+
+    def read_header(self, path):
+        size = len(self.buffer)
+        if size < HEADER.size:
+            raise ArchiveError('Truncated archive: {0}'.format(path))
+
+        (magic, version, reserved, self.game_count, sfen_count, name_count,
+         self.index_offset, sfen_table_offset, name_table_offset) = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            raise ArchiveError('Not an archive: {0}'.format(path))
+        if version != VERSION:
+            raise ArchiveError('Unsupported archive version {0}: {1}'.format(version, path))
+        if not HEADER.size <= self.index_offset <= size - OFFSET.size * self.game_count:
+            raise ArchiveError('Index out of bounds: {0}'.format(path))
+
+        try:
+            self.sfens = read_string_table(self.buffer, sfen_table_offset, sfen_count)
+            self.names = read_string_table(self.buffer, name_table_offset, name_count)
+        except ArchiveError as e:
+            raise ArchiveError('{0}: {1}'.format(e, path))
+        if ZERO_COPY:
+            self.view = memoryview(self.buffer)
+
+    def __len__(self):
+        return self.game_count
+
+    def game_header(self, index):
+        if index < 0:
+            index += self.game_count
+        if not 0 <= index < self.game_count:
+            raise IndexError('Game index out of range: {0}'.format(index))
+        offset = OFFSET.unpack_from(self.buffer, self.index_offset + OFFSET.size * index)[0]
+        if offset < HEADER.size or offset + GAME_HEADER.size > self.index_offset:
+            raise ArchiveError('Game {0} out of bounds'.format(index))
+
+        sfen_id, black, white, move_count, result, flags = GAME_HEADER.unpack_from(self.buffer, offset)
+        offset += GAME_HEADER.size
+        end = times_offset(offset, move_count) + 4 * move_count if flags & FLAG_TIMES else offset + 2 * move_count
+        if end > self.index_offset or sfen_id >= len(self.sfens) or result >= len(RESULTS) or \
+                any(name != NO_NAME and name >= len(self.names) for name in (black, white)):
+            raise ArchiveError('Invalid game {0}'.format(index))
+        return offset, sfen_id, black, white, move_count, result, flags
+
+    def array_at(self, typecode, offset, count):
+        size = array(typecode).itemsize * count
+        if ZERO_COPY:
+            return self.view[offset:offset + size].cast(typecode)
+        values = array(typecode, self.buffer[offset:offset + size])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values
+
+    def moves(self, index):
+        '''Returns the packed moves of a game as a memoryview (or array) of uint16.'''
+        offset, sfen_id, black, white, move_count, result, flags = self.game_header(index)
+        return self.array_at(MOVE_TYPECODE, offset, move_count)
+
+    def iter_moves(self):
+        '''
+        Yields the packed moves of each game as a memoryview of uint16,
+        without copying them. Each view is released when the iteration
+        moves on, copy it (e.g. with `tolist()`) to keep the moves.
+        '''
+        for index in range(self.game_count):
+            moves = self.moves(index)
+            try:
+                yield moves
+            finally:
+                release(moves)
+
+    def times(self, index):
+        '''Returns the seconds spent on each move as a memoryview (or array), or `None`.'''
+        offset, sfen_id, black, white, move_count, result, flags = self.game_header(index)
+        if not flags & FLAG_TIMES:
+            return None
+        return self.array_at(TIME_TYPECODE, times_offset(offset, move_count), move_count)
+
+    def __getitem__(self, index):
+        '''Reads a game as a `GameRecord`, with copies of its moves and times.'''
+        offset, sfen_id, black, white, move_count, result, flags = self.game_header(index)
+        moves = self.array_at(MOVE_TYPECODE, offset, move_count)
+        times = None
+        if flags & FLAG_TIMES:
+            times = self.array_at(TIME_TYPECODE, times_offset(offset, move_count), move_count)
+        try:
+            return GameRecord(self.sfens[sfen_id], array(MOVE_TYPECODE, moves),
+                              [None if name == NO_NAME else self.names[name] for name in (black, white)],
+                              RESULTS[result], None if times is None else array(TIME_TYPECODE, times))
+        finally:
+            release(moves)
+            if times is not None:
+                release(times)
+
+    def __iter__(self):
+        '''Yields each game as a `GameRecord`. See `iter_moves()` to avoid the copies.'''
+        for index in range(self.game_count):
+            yield self[index]
+
+    def close(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def records_from_files(paths, parser=None):
+    '''
+    Parses KIF or CSA files into game records. Without `parser` it is
+    chosen by the extension: `CSA.Parser` for .csa and `KIF.Parser`
+    otherwise.
+    '''
+    for path in paths:
+        file_parser = parser
+        if file_parser is None:
+            if path.lower().endswith('.csa'):
+                file_parser = CSA.Parser
+            else:
+                # The KIF parser needs Python 3, the rest of the module does not.
+                from shogi import KIF
+                file_parser = KIF.Parser
+        summaries = file_parser.parse_file(path)
+        if summaries is None:
+            raise ArchiveError('Can not parse {0}'.format(path))
+        for summary in summaries:
+            yield GameRecord.from_summary(summary)
+
+def convert(paths, archive_path, parser=None):
+    '''
+    Converts KIF or CSA files into an archive. Returns the number of games.
+    '''
+    count = 0
+    with open(archive_path, 'wb') as f:
+        with ArchiveWriter(f) as writer:
+            for record in records_from_files(paths, parser):
+                writer.add(record)
+                count += 1
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m shogi.archive',
+                                     description='Converts KIF and CSA files into a game archive.')
+    parser.add_argument('archive')
+    parser.add_argument('files', nargs='+')
+    args = parser.parse_args(argv)
+
+    print('games: {0}'.format(convert(args.files, args.archive)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the python-shogi library.
+# Copyright (C) 2015- Tasuku SUENAGA <tasuku-s-github@titech.ac>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Usage: python -m shogi.perft [--divide] [--hash-size N] [--processes N] <sfen> <depth>
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import time
+import argparse
+import collections
+import multiprocessing
+import shogi
+
+DEFAULT_HASH_SIZE = 1 << 20
+
+class PerftHashTable(object):
+    '''
+    A fixed size table of subtree node counts keyed by the Zobrist hash of
+    the position and the remaining depth. Colliding entries are replaced.
+    '''
+
+    def __init__(self, size=DEFAULT_HASH_SIZE):
+        if size < 1:
+            raise ValueError('Hash table size must be positive: {0}'.format(size))
+        self.size = size
+        self.entries = [None] * size
+        self.hits = 0
+
+    def get(self, key, depth):
+        entry = self.entries[(key ^ depth) % self.size]
+        if entry is not None and entry[0] == key and entry[1] == depth:
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, depth, count):
+        self.entries[(key ^ depth) % self.size] = (key, depth, count)
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.hits = 0
+
+def perft(board, depth, hash_table=None):
+    '''
+    Counts the leaf nodes of the legal move tree of the given depth.
+    The last ply is counted in bulk by `Board.count_legal_moves()`, and
+    transposed subtrees are looked up in `hash_table` if one is given.
+    '''
+    if depth < 1:
+        return 1
+    if depth == 1:
+        return board.count_legal_moves()
+
+    if hash_table is not None:
+        key = board.zobrist_hash()
+        count = hash_table.get(key, depth)
+        if count is not None:
+            return count
+
+    count = 0
+    for move_int in board.generate_legal_move_ints():
+        board.push_int(move_int)
+        count += perft(board, depth - 1, hash_table)
+        board.pop()
+
+    if hash_table is not None:
+        hash_table.put(key, depth, count)
+
+    return count
+
+def divide(board, depth, hash_table=None):
+    '''
+    Counts the leaf nodes below each legal move. Returns an ordered
+    dictionary of moves and counts.
+    '''
+    counts = collections.OrderedDict()
+    for move in board.generate_legal_moves():
+        board.push(move)
+        counts[move] = perft(board, depth - 1, hash_table)
+        board.pop()
+    return counts
+
+def split(board, depth, min_units):
+    '''
+    Expands the tree below `board` ply by ply until there are at least
+    `min_units` distinct positions or only one ply is left. Returns the
+    remaining depth and an ordered dictionary of SFENs and how many times
+    each position was reached.
+    '''
+    units = collections.OrderedDict([(board.sfen(), 1)])
+    while len(units) < min_units and depth > 1:
+        next_units = collections.OrderedDict()
+        for sfen, multiplicity in units.items():
+            unit_board = shogi.Board(sfen)
+            for move_int in unit_board.generate_legal_move_ints():
+                unit_board.push_int(move_int)
+                next_sfen = unit_board.sfen()
+                next_units[next_sfen] = next_units.get(next_sfen, 0) + multiplicity
+                unit_board.pop()
+        units = next_units
+        depth -= 1
+    return depth, units
+
+_worker_hash_table = None
+
+def _init_worker(hash_size):
+    global _worker_hash_table
+    _worker_hash_table = PerftHashTable(hash_size) if hash_size > 0 else None
+
+def _perft_sfen(sfen, depth):
+    return perft(shogi.Board(sfen), depth, _worker_hash_table)
+
+def parallel_perft(board, depth, processes=None, units_per_process=16, hash_size=DEFAULT_HASH_SIZE):
+    '''
+    Counts the leaf nodes like `perft()` using a pool of processes.
+    The first plies are expanded into many small work units sent as SFEN.
+    Idle processes keep taking units from the shared queue, so a few large
+    subtrees do not leave the others waiting. Each process has its own hash
+    table of `hash_size` entries.
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+
+    if depth < 2:
+        return perft(board, depth)
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    depth, units = split(board, depth, processes * units_per_process)
+
+    count = 0
+    with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(hash_size, )) as executor:
+        futures = [(executor.submit(_perft_sfen, sfen, depth), multiplicity)
+                   for sfen, multiplicity in units.items()]
+        for future, multiplicity in futures:
+            count += future.result() * multiplicity
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m shogi.perft',
+                                     description='Counts the leaf nodes of the legal move tree.')
+    parser.add_argument('sfen', help="SFEN of the root position or 'startpos'")
+    parser.add_argument('depth', type=int)
+    parser.add_argument('--divide', action='store_true', help='print the count below each move')
+    parser.add_argument('--hash-size', type=int, default=DEFAULT_HASH_SIZE,
+                        help='number of hash table entries, 0 to disable (default: %(default)s)')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='number of worker processes, 0 for one per CPU (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    board = shogi.Board(shogi.STARTING_SFEN if args.sfen == 'startpos' else args.sfen)
+    hash_table = PerftHashTable(args.hash_size) if args.hash_size > 0 else None
+
+    start = time.time()
+    if args.divide:
+        nodes = 0
+        for move, count in divide(board, args.depth, hash_table).items():
+            print('{0}: {1}'.format(move.usi(), count))
+            nodes += count
+        print()
+    elif args.processes != 1:
+        nodes = parallel_perft(board, args.depth, args.processes or None, hash_size=args.hash_size)
+    else:
+        nodes = perft(board, args.depth, hash_table)
+    elapsed = time.time() - start
+
+    print('nodes: {0}'.format(nodes))
+    print('time: {0:.3f}s'.format(elapsed))
+    print('nps: {0:.0f}'.format(nodes / elapsed if elapsed > 0 else 0))
+    if hash_table is not None and args.processes == 1:
+        print('hash hits: {0}'.format(hash_table.hits))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the python-shogi library.
+# Copyright (C) 2015- Tasuku SUENAGA <tasuku-s-github@titech.ac>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import numbers
+import shogi
+from array import array
+
+try:
+    from sys import intern
+except ImportError:
+    # A builtin on Python 2.
+    pass
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+DEFAULT_CHECKPOINT_INTERVAL = 16
+
+# Type code of the arrays of packed moves, which fit in 15 bits.
+MOVE_TYPECODE = 'H'
+
+# Type code of the arrays of seconds spent on each move.
+TIME_TYPECODE = 'I'
+
+def intern_string(string):
+    if string is None:
+        return None
+    try:
+        return intern(string)
+    except TypeError:
+        # Python 2 only interns byte strings.
+        return string
+
+def move_array(moves):
+    '''
+    Packs moves given as USI strings, packed integers or `Move` objects
+    into an array. Arrays of packed moves are returned as they are.
+    '''
+    if isinstance(moves, array) and moves.typecode == MOVE_TYPECODE:
+        return moves
+    move_ints = array(MOVE_TYPECODE)
+    for move in moves:
+        if isinstance(move, numbers.Integral):
+            move_ints.append(int(move))
+        elif isinstance(move, shogi.Move):
+            move_ints.append(move.to_int())
+        else:
+            move_ints.append(shogi.Move.from_usi(move).to_int())
+    return move_ints
+
+class GameRecord(object):
+    '''
+    A game as returned by the KIF and CSA parsers: the names of the
+    players, the start position, the moves and the winner ('b', 'w', '-'
+    or `None`), optionally with the seconds spent on each move.
+    The moves are kept as an array of packed integers and the start
+    position and the names as interned strings, so that large collections
+    of games fit in memory. Interned strings are shared while any record
+    uses them and freed afterwards. `summary` gives the
+    parser dictionary shape.
+    Positions are made on demand. While moving through the game the
+    position (without the move history, see `Board.packed_position()`) is
+    kept every `checkpoint_interval` plies, so `position_at()` makes at
+    most that many moves.
+    '''
+
+    __slots__ = ('sfen', 'move_ints', 'names', 'win', 'times', 'checkpoint_interval', 'checkpoints')
+
+    def __init__(self, sfen, moves, names=None, win=None, times=None,
+                 checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+        if checkpoint_interval < 1:
+            raise ValueError('Checkpoint interval must be positive: {0}'.format(checkpoint_interval))
+        self.sfen = intern_string(sfen)
+        self.move_ints = move_array(moves)
+        if names is None:
+            self.names = (None, None)
+        else:
+            self.names = tuple(intern_string(name) for name in names)
+        self.win = win
+        if times is None or (isinstance(times, array) and times.typecode == TIME_TYPECODE):
+            self.times = times
+        else:
+            self.times = array(TIME_TYPECODE, times)
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoints = None
+
+    @classmethod
+    def from_summary(cls, summary, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+        '''Builds a game record from a summary of `KIF.Parser` or `CSA.Parser`.'''
+        return cls(summary['sfen'], summary['moves'], summary.get('names'), summary.get('win'),
+                   summary.get('times'), checkpoint_interval)
+
+    @classmethod
+    def from_summaries(cls, summaries, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+        '''Builds game records from a list of parser summaries.'''
+        return [cls.from_summary(summary, checkpoint_interval) for summary in summaries]
+
+    def __len__(self):
+        return len(self.move_ints)
+
+    @property
+    def moves(self):
+        return [shogi.Move.from_int(move_int).usi() for move_int in self.move_ints]
+
+    @property
+    def summary(self):
+        return GameSummary(self)
+
+    def __getstate__(self):
+        # Checkpoints are not pickled, they are made again on demand.
+        return (self.sfen, self.move_ints, self.names, self.win, self.times, self.checkpoint_interval)
+
+    def __setstate__(self, state):
+        sfen, self.move_ints, names, self.win, self.times, self.checkpoint_interval = state
+        # Strings are not interned when unpickled.
+        self.sfen = intern_string(sfen)
+        self.names = tuple(intern_string(name) for name in names)
+        self.checkpoints = None
+
+    def checkpoint(self, board, ply):
+        if ply % self.checkpoint_interval == 0:
+            if self.checkpoints is None:
+                self.checkpoints = {}
+            if ply not in self.checkpoints:
+                self.checkpoints[ply] = board.packed_position()
+
+    def position_at(self, ply, history=False):
+        '''
+        Returns a new board with the position after the first `ply` moves.
+        Negative plies count from the end.
+        The board has no move history, unless `history` is set: then all
+        the moves are made from the start position and put on its move
+        stack, so that they can be popped and repetitions are counted.
+        '''
+        if ply < 0:
+            ply += len(self.move_ints) + 1
+        if not 0 <= ply <= len(self.move_ints):
+            raise IndexError('Ply out of range: {0}'.format(ply))
+
+        if history:
+            board = shogi.Board(self.sfen)
+            self.checkpoint(board, 0)
+            for i, move_int in enumerate(self.move_ints[:ply]):
+                board.push_int(move_int)
+                self.checkpoint(board, i + 1)
+            return board
+
+        # Start from the nearest checkpoint made so far.
+        start = ply - ply % self.checkpoint_interval
+        while start > 0 and (self.checkpoints is None or start not in self.checkpoints):
+            start -= self.checkpoint_interval
+
+        if start:
+            board = shogi.Board.from_packed_position(self.checkpoints[start])
+        else:
+            board = shogi.Board(self.sfen)
+            self.checkpoint(board, 0)
+
+        for i, move_int in enumerate(self.move_ints[start:ply]):
+            board.push_int(move_int)
+            self.checkpoint(board, start + i + 1)
+
+        return board.copy(stack=False) if start < ply else board
+
+    def positions(self):
+        '''
+        Yields the start position and the position after each move in a
+        single pass. The same board is moved forward between the
+        iterations, copy it to keep a position.
+        '''
+        board = shogi.Board(self.sfen)
+        self.checkpoint(board, 0)
+        yield board
+        for ply, move_int in enumerate(self.move_ints):
+            board.push_int(move_int)
+            self.checkpoint(board, ply + 1)
+            yield board
+
+    def to_summary(self):
+        '''Returns the game as a parser summary dictionary.'''
+        return dict(self.summary)
+
+class GameSummary(Mapping):
+    '''
+    A read-only view of a game record in the shape of the summaries of the
+    parsers, with the keys 'names', 'sfen', 'moves' and 'win', and 'times'
+    if the record has them.
+    '''
+
+    KEYS = ('names', 'sfen', 'moves', 'win')
+
+    def __init__(self, record):
+        self.record = record
+
+    def keys_of_record(self):
+        if self.record.times is None:
+            return GameSummary.KEYS
+        return GameSummary.KEYS + ('times', )
+
+    def __getitem__(self, key):
+        if key not in self.keys_of_record():
+            raise KeyError(key)
+        if key == 'names':
+            return list(self.record.names)
+        if key == 'times':
+            return list(self.record.times)
+        return getattr(self.record, key)
+
+    def __iter__(self):
+        return iter(self.keys_of_record())
+
+    def __len__(self):
+        return len(self.keys_of_record())
+
+    def __repr__(self):
+        return 'GameSummary({0})'.format(dict(self.items()))
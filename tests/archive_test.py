@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the python-shogi library.
+# Copyright (C) 2015- Tasuku SUENAGA <tasuku-s-github@titech.ac>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import shogi
+import unittest
+from array import array
+from shogi import CSA
+from shogi import archive
+from shogi.record import GameRecord
+from helpers import TEST_CSA, random_game
+
+def random_record(seed, plies):
+    board = random_game(seed, plies)
+    return GameRecord(shogi.STARTING_SFEN, board.move_stack, ['black{0}'.format(seed % 3), None],
+                      archive.RESULTS[seed % len(archive.RESULTS)])
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'games.shga')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        records = [random_record(seed, seed * 7) for seed in range(20)]
+        records.append(GameRecord('lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL b - 1',
+                                  ['7g7f', '3c3d', '8h2b+'], ['名人', '竜王'], 'b', [10, 0, 65536]))
+        archive.write(self.path, records)
+
+        with archive.Archive(self.path) as games:
+            self.assertEqual(len(games), len(records))
+            self.assertEqual(len(games.sfens), 2)
+            for record, game in zip(records, games):
+                self.assertEqual(game.summary, record.summary)
+
+            # Random access.
+            self.assertEqual(games[-1].names, ('名人', '竜王'))
+            self.assertEqual(list(games[-1].times), [10, 0, 65536])
+            self.assertEqual(games[5].moves, records[5].moves)
+            self.assertIsNone(games[5].times)
+            self.assertRaises(IndexError, lambda: games[len(records)])
+
+            moves = games.moves(19)
+            self.assertEqual(moves.tolist(), records[19].move_ints.tolist())
+            archive.release(moves)
+            times = games.times(-1)
+            self.assertEqual(times.tolist(), [10, 0, 65536])
+            archive.release(times)
+            self.assertIsNone(games.times(0))
+            self.assertEqual(games[-1].position_at(-1).sfen(), records[-1].position_at(-1).sfen())
+
+    def test_empty(self):
+        archive.write(self.path, [])
+        with archive.Archive(self.path) as games:
+            self.assertEqual(len(games), 0)
+            self.assertEqual(list(games), [])
+
+    def test_invalid(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'KIF!' + b'\0' * 60)
+        self.assertRaises(archive.ArchiveError, archive.Archive, self.path)
+
+    def test_truncated(self):
+        archive.write(self.path, [random_record(seed, 30) for seed in range(3)])
+        with open(self.path, 'rb') as f:
+            data = f.read()
+
+        for size in [0, 4, archive.HEADER.size - 1, archive.HEADER.size, len(data) - 1]:
+            with open(self.path, 'wb') as f:
+                f.write(data[:size])
+            self.assertRaises(archive.ArchiveError, archive.Archive, self.path)
+
+        # Offsets pointing outside of the file or at invalid data.
+        header = list(archive.HEADER.unpack_from(data))
+        for field, value in [(6, len(data)), (6, 0), (7, len(data) - 8), (8, 1 << 40)]:
+            corrupt = list(header)
+            corrupt[field] = value
+            with open(self.path, 'wb') as f:
+                f.write(archive.HEADER.pack(*corrupt) + data[archive.HEADER.size:])
+            self.assertRaises(archive.ArchiveError, archive.Archive, self.path)
+
+        with open(self.path, 'wb') as f:
+            f.write(data[:header[6]] + archive.OFFSET.pack(header[6] - 4) + data[header[6] + 8:])
+        with archive.Archive(self.path) as games:
+            self.assertRaises(archive.ArchiveError, games.moves, 0)
+            self.assertEqual(len(games[1]), len(random_record(1, 30)))
+
+    def test_iter_moves(self):
+        records = [random_record(seed, 20) for seed in range(5)]
+        archive.write(self.path, records)
+        with archive.Archive(self.path) as games:
+            views = []
+            for record, moves in zip(records, games.iter_moves()):
+                self.assertIsInstance(moves, memoryview if archive.ZERO_COPY else array)
+                self.assertEqual(moves.tolist(), record.move_ints.tolist())
+                views.append(moves)
+            self.assertEqual(len(views), len(records))
+            # Views are released as the iteration moves on.
+            if archive.ZERO_COPY:
+                self.assertRaises(ValueError, views[0].tolist)
+
+    def test_failed_write(self):
+        record = random_record(0, 10)
+        record.times = [1, 2]
+        with open(self.path, 'wb') as f:
+            with self.assertRaises(archive.ArchiveError):
+                with archive.ArchiveWriter(f) as writer:
+                    writer.add(random_record(1, 10))
+                    writer.add(record)
+        # Without the index and the header the partial archive does not open.
+        self.assertRaises(archive.ArchiveError, archive.Archive, self.path)
+
+        csa_path = os.path.join(self.directory, 'game.csa')
+        with open(csa_path, 'w') as f:
+            f.write(TEST_CSA)
+
+        class Parser(object):
+            @staticmethod
+            def parse_file(path):
+                return CSA.Parser.parse_file(path) if path == csa_path else None
+
+        self.assertRaises(archive.ArchiveError, archive.convert, [csa_path, 'unparsable.kif'], self.path, Parser)
+        self.assertRaises(archive.ArchiveError, archive.Archive, self.path)
+
+    def test_convert(self):
+        csa_path = os.path.join(self.directory, 'game.csa')
+        with open(csa_path, 'w') as f:
+            f.write(TEST_CSA)
+
+        self.assertEqual(archive.convert([csa_path, csa_path], self.path), 2)
+        with archive.Archive(self.path) as games:
+            self.assertEqual(len(games), 2)
+            self.assertEqual(games[1].names, ('NAKAHARA', 'YONENAGA'))
+            self.assertEqual(games[1].moves, ['2g2f', '3c3d', '7g7f'])
+            self.assertEqual(games[1].win, 'b')
+            self.assertEqual(len(games.names), 2)
+
+if __name__ == '__main__':
+    unittest.main()
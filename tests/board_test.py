@@ -18,8 +18,11 @@
 
 from __future__ import unicode_literals
 
+import warnings
+import collections
 import shogi
 import unittest
+from helpers import random_walk
 
 class BoardTestCase(unittest.TestCase):
     def test_default(self):
@@ -142,6 +145,47 @@ class BoardTestCase(unittest.TestCase):
         self.assertFalse(board.is_fourfold_repetition())
         board.push(shogi.Move.from_usi('6b8b'))
         self.assertTrue(board.is_fourfold_repetition())
+        self.assertEqual(board.repetition(), shogi.REPETITION_DRAW)
+        board.pop()
+        self.assertEqual(board.repetition(), shogi.REPETITION_NONE)
+        self.assertEqual(board.repetition(count=3), shogi.REPETITION_DRAW)
+        while board.move_stack:
+            board.pop()
+        self.assertEqual(len(board.transpositions), 1)
+
+    def test_repetition(self):
+        # Black checks with the rook on every move.
+        board = shogi.Board('4k4/9/9/9/9/9/9/9/R3K4 b - 1')
+        board.push_usi('9i9a')
+        for i in range(3):
+            for usi in ['5a5b', '9a9b', '5b5a', '9b9a']:
+                board.push_usi(usi)
+        self.assertEqual(board.repetition(), shogi.REPETITION_WIN)
+        board.pop()
+        self.assertEqual(board.repetition(), shogi.REPETITION_NONE)
+        self.assertEqual(board.repetition(count=3), shogi.REPETITION_LOSE)
+
+        board = shogi.Board('4k4/9/9/9/9/9/9/9/R3K4 w - 1')
+        for i in range(3):
+            for usi in ['5a5b', '9i9h', '5b5a', '9h9i']:
+                board.push_usi(usi)
+        self.assertEqual(board.repetition(), shogi.REPETITION_DRAW)
+
+        # White dropped a pawn which black took.
+        board = shogi.Board('8k/9/9/9/9/9/9/4R4/4K4 w p 1')
+        for usi in ['P*5d', '5h5d', '1a2a', '5d5c', '2a1a', '5c5h']:
+            board.push_usi(usi)
+        self.assertEqual(board.sfen(), '8k/9/9/9/9/9/9/4R4/4K4 w P 7')
+        self.assertEqual(board.repetition(), shogi.REPETITION_INFERIOR)
+        board.push_usi('1a2a')
+        board.push_usi('5h5g')
+        board.push_usi('2a1a')
+        board.push_usi('5g5h')
+        self.assertEqual(board.repetition(), shogi.REPETITION_INFERIOR)
+        self.assertEqual(board.repetition(count=2), shogi.REPETITION_DRAW)
+        board.push(shogi.Move.null())
+        board.push(shogi.Move.null())
+        self.assertEqual(board.repetition(), shogi.REPETITION_NONE)
 
     def test_legal_moves_in(self):
         # https://github.com/gunyarakun/python-shogi/issues/3
@@ -224,5 +268,518 @@ class BoardTestCase(unittest.TestCase):
         with self.assertRaises(ValueError):
             board.push_usi_position_cmd("position moves")
 
+    def test_set_position(self):
+        board = shogi.Board()
+        self.assertEqual(board.set_position(shogi.STARTING_SFEN, ['7g7f', '3c3d']), 0)
+        states = list(board.states)
+        self.assertEqual(board.set_position(shogi.STARTING_SFEN, ['7g7f', '3c3d', '8h2b+']), 2)
+        self.assertIs(board.states[1], states[1])
+        self.assertEqual(board.set_position(shogi.STARTING_SFEN, ['7g7f', '3c3d', '2g2f', '3a2b']), 2)
+        expected = shogi.Board()
+        for usi in ['7g7f', '3c3d', '2g2f', '3a2b']:
+            expected.push_usi(usi)
+        self.assertEqual(board.sfen(), expected.sfen())
+        self.assertEqual(board.zobrist_hash(), expected.zobrist_hash())
+        self.assertEqual(board.set_position(shogi.STARTING_SFEN, ['2g2f']), 0)
+        self.assertEqual([move.usi() for move in board.move_stack], ['2g2f'])
+
+        board.push_usi_position_cmd('position startpos moves 2g2f 8c8d')
+        self.assertEqual(len(board.move_stack), 2)
+        sfen = board.sfen()
+        self.assertEqual(board.set_position(sfen, ['7g7f']), 0)
+        self.assertEqual(board.set_position(sfen, ['7g7f', '8d8e']), 1)
+        self.assertEqual(board.set_position(shogi.STARTING_SFEN, []), 0)
+        self.assertEqual(board.sfen(), shogi.STARTING_SFEN)
+
+        # No history, but not at the start position.
+        board.replay(['7g7f', '3c3d'], keep_history=False)
+        self.assertEqual(board.set_position(shogi.STARTING_SFEN, ['7g7f']), 0)
+        self.assertEqual([move.usi() for move in board.move_stack], ['7g7f'])
+        expected = shogi.Board()
+        expected.push_usi('7g7f')
+        self.assertEqual(board.sfen(), expected.sfen())
+
+        # A colliding Zobrist key does not keep a history from another position.
+        board = shogi.Board()
+        board.push_usi('7g7f')
+        board.states[0].zobrist_key = shogi.decode_sfen(sfen)[10]
+        board.move_number = 3
+        self.assertEqual(board.set_position(sfen, ['7g7f']), 0)
+        expected = shogi.Board(sfen)
+        expected.push_usi('7g7f')
+        self.assertEqual(board.sfen(), expected.sfen())
+
+        board = shogi.Board()
+        board.remove_piece_at(shogi.A1)
+        board.zobrist_key = shogi.decode_sfen(shogi.STARTING_SFEN)[10]
+        self.assertEqual(board.set_position(shogi.STARTING_SFEN, []), 0)
+        self.assertEqual(board.sfen(), shogi.STARTING_SFEN)
+
+    def test_replay(self):
+        usi_moves = ['7g7f', '3c3d', '8h2b+', '3a2b', 'B*4e', '2b3c', '4e3d', '3c3d']
+        expected = shogi.Board()
+        for usi in usi_moves:
+            expected.push_usi(usi)
+
+        board = shogi.Board().replay(usi_moves)
+        self.assertEqual(board.sfen(), expected.sfen())
+        self.assertEqual(len(board.move_stack), len(usi_moves))
+
+        for moves in [usi_moves,
+                      [shogi.Move.from_usi(usi).to_int() for usi in usi_moves],
+                      [shogi.Move.from_usi(usi) for usi in usi_moves]]:
+            board = shogi.Board(track_attacks=True).replay(moves, keep_history=False)
+            self.assertEqual(board.sfen(), expected.sfen())
+            self.assertEqual(board.zobrist_hash(), expected.zobrist_hash())
+            self.assertEqual(board.pieces_in_hand[shogi.WHITE], {shogi.BISHOP: 2})
+            self.assertEqual(board.attack_maps, shogi.Board(expected.sfen(), track_attacks=True).attack_maps)
+            self.assertFalse(board.move_stack)
+            self.assertEqual(set(board.legal_moves), set(expected.legal_moves))
+
+        board = shogi.Board()
+        with self.assertRaises(ValueError):
+            board.replay(['7g7f', '3c3d', '8h2b', '2b3c'], trusted=False)
+        self.assertEqual(len(board.move_stack), 3)
+
+        # Without history the moves already on the stack would be lost.
+        sfen = board.sfen()
+        with self.assertRaises(ValueError):
+            board.replay(['2g2f'], keep_history=False)
+        self.assertEqual(len(board.move_stack), 3)
+        self.assertEqual(board.sfen(), sfen)
+
+        board = shogi.Board()
+        with self.assertRaises(ValueError):
+            board.replay(['7g7f', '3c3d', '8h2b', '2b3c'], trusted=False, keep_history=False)
+        self.assertFalse(board.move_stack)
+        self.assertEqual(board.transpositions, collections.Counter((board.zobrist_hash(), )))
+
+    def test_move_ints(self):
+        for sfen in [shogi.STARTING_SFEN,
+                     'k8/9/9/9/9/9/9/9/P8 b P 1',
+                     'ln1g3+Rl/1ks4s1/pp1gppbpp/2p3N2/9/5P1P1/PPPP1S1bP/2K1R1G2/LNSG3NL w 4p 42',
+                     'kn7/9/1G7/9/9/9/9/9/9 b P 1']:
+            board = shogi.Board(sfen)
+            self.assertEqual(list(board.generate_pseudo_legal_move_ints()),
+                             [move.to_int() for move in board.generate_pseudo_legal_moves()])
+            self.assertEqual(list(board.generate_legal_move_ints()),
+                             [move.to_int() for move in board.generate_legal_moves()])
+
+        board = shogi.Board()
+        move_int = shogi.move_int_from_usi('7g7f')
+        board.push_int(move_int)
+        self.assertEqual(board.peek(), shogi.Move.from_usi('7g7f'))
+        self.assertEqual(board.pop_int(), move_int)
+        self.assertEqual(board.sfen(), shogi.STARTING_SFEN)
+
+    def test_sliding_backends(self):
+        sfens = [
+            '9/9/9/9/4B4/9/9/9/9 b - 1',
+            '9/9/9/9/4L4/9/9/9/9 b - 1',
+            'lnsg1g1nl/3k3r1/pppp1s1pp/b3p1p2/2PP1p2B/P3P3P/1P3PPP1/1S3K1R1/LN1G1GSNL w - 1',
+            'ln1g3+Rl/1ks4s1/pp1gppbpp/2p3N2/9/5P1P1/PPPP1S1bP/2K1R1G2/LNSG3NL w 4p 42',
+        ]
+        previous = shogi.sliding_backend.name
+        try:
+            expected = None
+            for name in shogi.SLIDING_BACKENDS:
+                shogi.set_sliding_backend(name)
+                moves = [sorted(move.usi() for move in shogi.Board(sfen).legal_moves) for sfen in sfens]
+                if expected is None:
+                    expected = moves
+                self.assertEqual(moves, expected)
+
+            # Boards created with another backend still work after switching.
+            shogi.set_sliding_backend('direct')
+            board = shogi.Board(sfens[3])
+            shogi.set_sliding_backend('rotated')
+            board.push_usi('2g5d+')
+            board.pop()
+            self.assertEqual(sorted(move.usi() for move in board.legal_moves), expected[3])
+        finally:
+            shogi.set_sliding_backend(previous)
+
+        with self.assertRaises(ValueError):
+            shogi.set_sliding_backend('unknown')
+
+    def test_attacks_from(self):
+        board = shogi.Board('9/9/9/9/4B4/9/9/9/9 b - 1')
+        occupied = board.occupied
+        self.assertEqual(shogi.Board.attacks_from(shogi.NONE, shogi.E5, occupied, shogi.BLACK), shogi.BB_VOID)
+        self.assertEqual(shogi.Board.attacks_from(shogi.PROM_PAWN, shogi.E5, occupied, shogi.WHITE),
+                         shogi.BB_GOLD_ATTACKS[shogi.WHITE][shogi.E5])
+        bishop = shogi.Board.attacks_from(shogi.BISHOP, shogi.E5, occupied, shogi.BLACK)
+        self.assertEqual(len(shogi.SquareSet(bishop)), 16)
+        self.assertEqual(shogi.Board.attacks_from(shogi.PROM_BISHOP, shogi.E5, occupied, shogi.BLACK),
+                         bishop | shogi.BB_KING_ATTACKS[shogi.E5])
+        lance = shogi.Board.attacks_from(shogi.LANCE, shogi.E5, occupied, shogi.WHITE)
+        self.assertEqual(shogi.SquareSet(lance), shogi.SquareSet(shogi.BB_F5 | shogi.BB_G5 | shogi.BB_H5 | shogi.BB_I5))
+
+    def test_shared_pieces(self):
+        board = shogi.Board()
+        self.assertIs(board.piece_at(shogi.A9), shogi.Piece.get(shogi.LANCE, shogi.WHITE))
+        self.assertIs(board.piece_at(shogi.I1), shogi.Piece.from_symbol('L'))
+        self.assertIs(shogi.Piece.get(shogi.PROM_SUI, shogi.BLACK), shogi.Piece.from_symbol('+Z'))
+
+        board.set_piece_type_at(shogi.E5, shogi.SILVER, shogi.WHITE)
+        self.assertEqual(board.piece_at(shogi.E5), shogi.Piece(shogi.SILVER, shogi.WHITE))
+        board.set_piece_at(shogi.E5, shogi.Piece(shogi.GOLD, shogi.BLACK))
+        self.assertIs(board.piece_at(shogi.E5), shogi.Piece.from_symbol('G'))
+
+        for symbol in ['', '+', 'x', '+G']:
+            with self.assertRaises(ValueError):
+                shogi.Piece.from_symbol(symbol)
+
+    def test_pop_capture_sui(self):
+        sfen = '4k4/9/4z4/9/4R4/9/9/9/4K4 b - 1'
+        board = shogi.Board(sfen)
+        zobrist_hash = board.zobrist_hash()
+        board.push_usi('5e5c')
+        self.assertEqual(board.pieces_in_hand[shogi.BLACK][shogi.SUI], 0)
+        board.pop()
+        self.assertEqual(board.sfen(), sfen)
+        self.assertEqual(board.zobrist_hash(), zobrist_hash)
+
+    def test_pinned_and_checkers(self):
+        board = shogi.Board('4r4/9/9/9/9/9/9/4S4/4K4 b - 1')
+        self.assertEqual(board.pinned_mask(), shogi.BB_H5)
+        self.assertEqual(board.checkers_mask(), shogi.BB_VOID)
+        self.assertEqual(set(move.usi() for move in board.legal_moves), set(['5h5g', '5i4h', '5i6h', '5i4i', '5i6i']))
+
+        board = shogi.Board('4k4/9/9/9/8b/9/9/4S4/4K4 b P 1')
+        self.assertEqual(board.pinned_mask(), shogi.BB_VOID)
+        self.assertEqual(board.checkers_mask(), shogi.BB_E1)
+        self.assertEqual(set(move.usi() for move in board.legal_moves),
+                         set(['5i4i', '5i6h', '5i6i', 'P*2f', 'P*3g', 'P*4h']))
+
+        # Both kings: no check at all.
+        board = shogi.Board('4k4/9/9/9/8b/9/9/9/3+ZK4 b - 1')
+        self.assertEqual(board.checkers_mask(), shogi.BB_VOID)
+
+    def test_legal_moves_match_make_unmake(self):
+        for sfen in ['ln1g5/1r2S1k2/p2pppn2/2ps2p2/1p7/2P6/PPSPPPPLP/2G2K1pr/LN4G1b w BGSLPnp 62',
+                     'lnsgkgsnl/1r2z2b1/ppppppppp/9/9/9/PPPPPPPPP/1B2Z2R1/LNSGKGSNL b - 1',
+                     '8k/9/8P/9/9/9/9/9/K8 b P 1',
+                     '4k4/4l4/9/9/4G4/9/9/9/4K4 b - 1']:
+            board = shogi.Board(sfen)
+            expected = [move for move in board.pseudo_legal_moves
+                        if not board.is_suicide_or_check_by_dropping_pawn(move)]
+            self.assertEqual(list(board.legal_moves), expected)
+
+    def test_evasions(self):
+        for sfen in ['4k4/9/9/9/8b/9/9/4S4/4K4 b GP 1',
+                     '4k4/9/9/9/8b/9/4l4/4S4/4K4 b - 1',
+                     '4k4/9/9/9/4r4/9/9/9/4K4 b RBGSNLP 1',
+                     '4k4/9/9/9/4r4/9/9/3z5/4K4 b - 1']:
+            board = shogi.Board(sfen)
+            self.assertTrue(board.is_check())
+            expected = [move.to_int() for move in board.pseudo_legal_moves
+                        if not board.is_suicide_or_check_by_dropping_pawn(move)]
+            self.assertEqual(list(board.generate_evasion_move_ints()), expected)
+            self.assertEqual(list(board.generate_legal_move_ints()), expected)
+            self.assertEqual([move.to_int() for move in board.legal_moves], expected)
+
+        board = shogi.Board('4k4/9/9/9/9/9/9/3PPP3/4K3r b - 1')
+        self.assertEqual(list(board.generate_evasion_move_ints()), [])
+        self.assertTrue(board.is_checkmate())
+        self.assertTrue(board.is_game_over())
+        self.assertFalse(board.is_stalemate())
+
+    def test_count_moves(self):
+        for sfen in [shogi.STARTING_SFEN,
+                     'ln1g5/1r2S1k2/p2pppn2/2ps2p2/1p7/2P6/PPSPPPPLP/2G2K1pr/LN4G1b w BGSLPnp 62',
+                     '4k4/9/9/9/8b/9/4l4/4S4/4K4 b GP 1',
+                     '8k/9/8P/9/9/9/9/9/K8 b P 1',
+                     '4k4/9/9/9/4r4/9/9/3z5/4K4 b - 1',
+                     '4k4/9/9/9/4r4/9/9/2z6/9 b - 1']:
+            board = shogi.Board(sfen)
+            self.assertEqual(board.count_pseudo_legal_moves(), len(list(board.generate_pseudo_legal_moves())))
+            self.assertEqual(board.count_legal_moves(), len(list(board.generate_legal_moves())))
+            self.assertEqual(len(board.legal_moves), board.count_legal_moves())
+            self.assertEqual(len(board.pseudo_legal_moves), board.count_pseudo_legal_moves())
+
+    def test_attack_maps(self):
+        board = shogi.Board(track_attacks=True)
+        plain_board = shogi.Board()
+        for move in random_walk(plain_board, 1, 60):
+            board.push(move)
+            attack_maps = list(board.attack_maps)
+            board.update_attack_maps()
+            self.assertEqual(board.attack_maps, attack_maps)
+            for square in shogi.SQUARES:
+                for color in shogi.COLORS:
+                    self.assertEqual(board.is_attacked_by(color, square), plain_board.is_attacked_by(color, square))
+            self.assertEqual(list(board.legal_moves), list(plain_board.legal_moves))
+            self.assertEqual(len(board.legal_moves), len(plain_board.legal_moves))
+        while board.move_stack:
+            board.pop()
+        self.assertEqual(board.attack_counts, shogi.Board(track_attacks=True).attack_counts)
+
+        board.disable_attack_maps()
+        self.assertIsNone(board.attack_maps)
+        board.enable_attack_maps()
+        self.assertTrue(board.is_attacked_by(shogi.BLACK, shogi.F7))
+
+    def test_attackers_to(self):
+        board = shogi.Board('ln1g5/1r2S1k2/p2pppn2/2ps2p2/1p7/2P6/PPSPPPPLP/2G2K1pr/LN4G1b w BGSLPnp 62')
+        for square in shogi.SQUARES:
+            self.assertEqual(board.attackers_to(square),
+                             board.attacker_mask(shogi.BLACK, square) | board.attacker_mask(shogi.WHITE, square))
+
+        # Rooks stacked on a file: the second one attacks through the first.
+        board = shogi.Board('4k4/9/9/9/4r4/9/4R4/4R4/4K4 b - 1')
+        self.assertEqual(board.attackers_to(shogi.F5), shogi.BB_E5 | shogi.BB_G5)
+        occupied = board.occupied.bits ^ shogi.BB_G5
+        self.assertEqual(board.attackers_to(shogi.F5, occupied), shogi.BB_E5 | shogi.BB_H5)
+
+    def test_pieces_in_hand(self):
+        board = shogi.Board('4k4/9/9/9/9/9/9/9/4K4 b 2RG3Pbs2l 1')
+        black = board.pieces_in_hand[shogi.BLACK]
+        white = board.pieces_in_hand[shogi.WHITE]
+        self.assertEqual(black, collections.Counter({shogi.ROOK: 2, shogi.GOLD: 1, shogi.PAWN: 3}))
+        self.assertEqual(dict(white), {shogi.BISHOP: 1, shogi.SILVER: 1, shogi.LANCE: 2})
+        self.assertEqual(black[shogi.KNIGHT], 0)
+        self.assertEqual(black[shogi.SUI], 0)
+        self.assertNotIn(shogi.KNIGHT, black)
+        self.assertIn(shogi.ROOK, black)
+        self.assertEqual(len(black), 3)
+        self.assertEqual(sorted(white.elements()), [shogi.LANCE, shogi.LANCE, shogi.SILVER, shogi.BISHOP])
+
+        board.push_usi('P*5e')
+        self.assertEqual(black[shogi.PAWN], 2)
+        board.pop()
+        self.assertEqual(black[shogi.PAWN], 3)
+
+        self.assertTrue(black >= {shogi.ROOK: 1, shogi.PAWN: 3})
+        self.assertFalse(black >= {shogi.ROOK: 1, shogi.PAWN: 4})
+        self.assertTrue(black <= {shogi.ROOK: 2, shogi.GOLD: 1, shogi.PAWN: 5, shogi.BISHOP: 1})
+        self.assertFalse(black >= white)
+        self.assertTrue(shogi.hand_is_superior(black.packed, shogi.pack_hand({shogi.GOLD: 1})))
+        with self.assertRaises(ValueError):
+            shogi.pack_hand({shogi.KING: 1})
+
+        with self.assertRaises(ValueError):
+            board.remove_piece_from_hand(shogi.KNIGHT, shogi.BLACK)
+        board.turn = shogi.WHITE
+        with self.assertRaises(ValueError) as context:
+            board.remove_piece_from_hand(shogi.KNIGHT, shogi.BLACK)
+        self.assertEqual(str(context.exception), 'The piece is not in hand: N')
+
+    def test_hand_limits(self):
+        for hand in ['32P', '64P', '100P', '31P31P', '31P1P']:
+            with self.assertRaises(ValueError):
+                shogi.Board('4k4/9/9/9/9/9/9/9/4K4 b {0} 1'.format(hand))
+        board = shogi.Board('4k4/9/9/9/9/9/9/9/4K4 b 31P 1')
+        self.assertEqual(board.pieces_in_hand[shogi.BLACK], {shogi.PAWN: 31})
+
+        board = shogi.Board('4k4/9/9/9/9/9/9/9/4K4 b 2P 1')
+        for count in [30, 64, 100, -1]:
+            with self.assertRaises(ValueError):
+                board.add_piece_into_hand(shogi.PAWN, shogi.BLACK, count)
+            self.assertEqual(board.sfen(), '4k4/9/9/9/9/9/9/9/4K4 b 2P 1')
+        board.add_piece_into_hand(shogi.PAWN, shogi.BLACK, 29)
+        self.assertEqual(board.zobrist_hash(), shogi.Board('4k4/9/9/9/9/9/9/9/4K4 b 31P 1').zobrist_hash())
+
+    def test_zobrist_hash(self):
+        board = shogi.Board()
+        board.check_zobrist = True
+        for move in random_walk(board, 2, 60):
+            self.assertEqual(board.zobrist_hash(), shogi.Board(board.sfen()).zobrist_hash())
+        while board.move_stack:
+            board.pop()
+            board.zobrist_hash()
+        self.assertEqual(board.zobrist_hash(), shogi.Board().zobrist_hash())
+
+        self.assertNotEqual(shogi.Board('4k4/9/9/9/9/9/9/9/4K4 b Pp 1').zobrist_hash(),
+                            shogi.Board('4k4/9/9/9/9/9/9/9/4K4 b P2p 1').zobrist_hash())
+
+        # The former key computed from a given array is deprecated.
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            legacy = board.zobrist_hash(shogi.DEFAULT_RANDOM_ARRAY)
+        self.assertEqual([warning.category for warning in caught], [DeprecationWarning])
+        self.assertEqual(legacy, board.board_zobrist_hash(shogi.DEFAULT_RANDOM_ARRAY))
+        self.assertNotEqual(shogi.Board('4k4/9/9/9/9/9/9/9/4K4 b - 1').zobrist_hash(),
+                            shogi.Board('4k4/9/9/9/9/9/9/9/4K4 w - 1').zobrist_hash())
+
+        board.turn ^= 1
+        with self.assertRaises(AssertionError):
+            board.zobrist_hash()
+
+    def test_zobrist_hash128(self):
+        board = shogi.Board(wide_zobrist=True)
+        board.check_zobrist = True
+        hashes = set()
+        for move in random_walk(board, 3, 60):
+            hash128 = board.zobrist_hash128()
+            self.assertEqual(hash128 & ((1 << 64) - 1), board.zobrist_hash())
+            self.assertEqual(hash128, shogi.Board(board.sfen()).zobrist_hash128())
+            hashes.add(hash128 >> 64)
+        self.assertGreater(len(hashes), 1)
+        while board.move_stack:
+            board.pop()
+            board.zobrist_hash128()
+        self.assertEqual(board.zobrist_hash128(), shogi.Board().zobrist_hash128())
+
+        board.disable_wide_zobrist()
+        self.assertIsNone(board.zobrist_key_high)
+        board.push_usi('7g7f')
+        board.enable_wide_zobrist()
+        self.assertEqual(board.zobrist_hash128(), shogi.Board(board.sfen()).zobrist_hash128())
+
+    def test_copy(self):
+        board = shogi.Board(track_attacks=True, wide_zobrist=True)
+        for usi in ['7g7f', '3c3d', '8h2b+', '3a2b', 'B*4e']:
+            board.push_usi(usi)
+
+        copy = board.copy()
+        self.assertEqual(copy, board)
+        self.assertEqual(copy.sfen(), board.sfen())
+        self.assertEqual(copy.zobrist_hash128(), board.zobrist_hash128())
+        self.assertEqual(list(copy.move_stack), list(board.move_stack))
+        self.assertEqual(copy.pieces_in_hand[shogi.BLACK], board.pieces_in_hand[shogi.BLACK])
+        self.assertEqual(copy.attack_maps, board.attack_maps)
+        self.assertEqual(set(copy.legal_moves), set(board.legal_moves))
+
+        copy.push_usi('2b4d')
+        copy.push_usi('4e3d')
+        self.assertEqual(len(board.move_stack), 5)
+        self.assertNotEqual(copy.occupied, board.occupied)
+        self.assertEqual(copy.sfen(), shogi.Board(copy.sfen()).sfen())
+        self.assertEqual(copy.attack_maps, shogi.Board(copy.sfen(), track_attacks=True).attack_maps)
+        while copy.move_stack:
+            copy.pop()
+        self.assertEqual(copy.sfen(), shogi.STARTING_SFEN)
+        self.assertEqual(copy.zobrist_hash128(), shogi.Board().zobrist_hash128())
+
+        copy = board.copy(stack=2)
+        self.assertEqual(list(copy.move_stack), list(board.move_stack)[-2:])
+        copy.pop()
+        copy.pop()
+        self.assertEqual(copy.zobrist_hash(), shogi.Board(copy.sfen()).zobrist_hash())
+
+        copy = board.copy(stack=False)
+        self.assertFalse(copy.move_stack)
+        self.assertEqual(copy.transpositions[copy.zobrist_hash()], 1)
+        self.assertEqual(copy.sfen(), board.sfen())
+
+    def test_snapshot(self):
+        board = shogi.Board(track_attacks=True)
+        board.push_usi('7g7f')
+        sfen = board.sfen()
+        snapshot = board.snapshot()
+        for i in range(2):
+            board.push_usi('3c3d')
+            board.push_usi('8h2b+')
+            board.restore(snapshot)
+            self.assertEqual(board.sfen(), sfen)
+            self.assertEqual(board.zobrist_hash(), shogi.Board(sfen).zobrist_hash())
+            self.assertEqual(board.attack_maps, shogi.Board(sfen, track_attacks=True).attack_maps)
+            self.assertEqual(len(board.move_stack), 1)
+
+        board.pop()
+        board.push_usi('2g2f')
+        board.restore(snapshot)
+        self.assertEqual(board.peek().usi(), '7g7f')
+        board.pop()
+        self.assertEqual(board.sfen(), shogi.STARTING_SFEN)
+
+    def test_packed_position(self):
+        for sfen in [shogi.STARTING_SFEN,
+                     'l6nl/5+P1gk/2np1S3/p1p4Pp/3P2Sp1/1PPb2P1P/P5GS1/R8/LN4bKL w RGgsn5p 1',
+                     '1+z6k/9/1G7/9/9/9/9/9/9 w - 1']:
+            board = shogi.Board(sfen, track_attacks=True, wide_zobrist=True)
+            if board.legal_moves:
+                board.push(next(iter(board.legal_moves)))
+            position = shogi.Board.from_packed_position(board.packed_position(), track_attacks=True)
+            self.assertEqual(position.sfen(), board.sfen())
+            self.assertEqual(position.zobrist_hash128(), board.zobrist_hash128())
+            self.assertEqual(position.king_squares, board.king_squares)
+            self.assertEqual(position.promsui_squares, board.promsui_squares)
+            self.assertEqual(position.kings_living, board.kings_living)
+            self.assertEqual(position.piece_bb, board.piece_bb)
+            self.assertEqual(position.attack_maps, board.attack_maps)
+            self.assertEqual(set(position.legal_moves), set(board.legal_moves))
+            self.assertFalse(position.move_stack)
+
+    def test_state_stack(self):
+        board = shogi.Board()
+        for usi in ['7g7f', '3c3d', '8h2b+', '3a2b', 'B*4e']:
+            board.push_usi(usi)
+        self.assertEqual(len(board.states), 5)
+        self.assertEqual([move.usi() for move in board.move_stack], ['7g7f', '3c3d', '8h2b+', '3a2b', 'B*4e'])
+        self.assertEqual(board.move_stack[-1], shogi.Move.from_usi('B*4e'))
+        self.assertEqual(board.move_stack[1:3], [shogi.Move.from_usi('3c3d'), shogi.Move.from_usi('8h2b+')])
+        self.assertEqual(board.captured_piece_stack, [0, 0, shogi.BISHOP, shogi.PROM_BISHOP, 0])
+        self.assertEqual(board.states[2].hand, 0)
+        self.assertEqual(board.states[4].hand, shogi.pack_hand({shogi.BISHOP: 1}))
+
+        board.pop()
+        self.assertEqual(board.pieces_in_hand[shogi.BLACK], {shogi.BISHOP: 1})
+        board.pop()
+        self.assertEqual(board.piece_at(shogi.B2), shogi.Piece.from_symbol('+B'))
+        self.assertEqual(board.pieces_in_hand[shogi.WHITE], {})
+        self.assertEqual(board.zobrist_hash(), shogi.Board(board.sfen()).zobrist_hash())
+        board.push(shogi.Move.null())
+        board.pop()
+        self.assertEqual(board.transpositions[board.zobrist_hash()], 1)
+        self.assertEqual(list(reversed(board.move_stack))[0].usi(), '8h2b+')
+
+    def test_sfen_cache(self):
+        sfen = 'lnsgkgsnl/1r2z2b1/ppppppppp/9/9/2P6/PP1PPPPPP/1B2Z2R1/LNSGKGSNL w - 2'
+        previous_size = shogi.set_sfen_cache_size(2)
+        try:
+            board = shogi.Board(sfen)
+            self.assertIn(sfen, shogi.sfen_cache)
+            board.push_usi('3c3d')
+            board.push_usi('8h2b+')
+
+            cached = shogi.Board(sfen)
+            self.assertEqual(cached.sfen(), sfen)
+            self.assertEqual(cached.piece_at(shogi.B2), shogi.Piece.from_symbol('b'))
+            uncached = shogi.Board()
+            shogi.set_sfen_cache_size(0)
+            self.assertFalse(shogi.sfen_cache)
+            uncached.set_sfen(sfen)
+            self.assertEqual(cached, uncached)
+            self.assertEqual(cached.zobrist_hash(), uncached.zobrist_hash())
+        finally:
+            shogi.set_sfen_cache_size(previous_size)
+
+        board = shogi.Board()
+        board.set_sfen(sfen, validate=False)
+        self.assertEqual(board.sfen(), sfen)
+        for invalid_sfen in ['lnsgkgsnl+/1r2z2b1/ppppppppp/9/9/9/PPPPPPPPP/1B2Z2R1/LNSGKGSNL b - 1',
+                             'lnsgkgsnl/1r2z2b1/ppppppppp/9/9/9/PPPPPPPPP/1B2Z2R1/LNSGKGSNL/9 b - 1',
+                             'lnsgkgsnl/1r2z2b1/ppppppppp/9/9/9/PPPPPPPPP/1B2Z2R1/LNSGKGSNL b 32P 1',
+                             'lnsgkgsnl/1r2z2b1/ppppppppp/9/9/9/PPPPPPPPP/1B2Z2R1/LNSG+KGSNL b - 1']:
+            with self.assertRaises(ValueError):
+                board.set_sfen(invalid_sfen)
+
+    def test_sfen_fragments(self):
+        board = shogi.Board()
+        self.assertEqual(board.sfen(), shogi.STARTING_SFEN)
+        self.assertEqual(board.sfen_ranks[1], '1r2z2b1')
+
+        board.push_usi('7g7f')
+        self.assertIsNone(board.sfen_ranks[6])
+        self.assertEqual(board.sfen_ranks[1], '1r2z2b1')
+        board.push_usi('3c3d')
+        board.push_usi('8h2b+')
+        self.assertEqual(board.sfen(), 'lnsgkgsnl/1r2z2+B1/pppppp1pp/6p2/9/2P6/PP1PPPPPP/4Z2R1/LNSGKGSNL w B 4')
+        self.assertEqual(board.sfen_hand, 'B')
+
+        board.remove_piece_at(shogi.I5)
+        board.set_piece_at(shogi.E5, shogi.Piece.from_symbol('k'))
+        self.assertEqual(board.sfen(), 'lnsgkgsnl/1r2z2+B1/pppppp1pp/6p2/4k4/2P6/PP1PPPPPP/4Z2R1/LNSG1GSNL w B 4')
+        board.remove_piece_at(shogi.E5)
+        board.set_piece_at(shogi.I5, shogi.Piece.from_symbol('K'))
+
+        board.pop()
+        self.assertEqual(board.sfen(), 'lnsgkgsnl/1r2z2b1/pppppp1pp/6p2/9/2P6/PP1PPPPPP/1B2Z2R1/LNSGKGSNL b - 3')
+        board.pop()
+        board.pop()
+        self.assertEqual(board.sfen(), shogi.STARTING_SFEN)
+
 if __name__ == '__main__':
     unittest.main()
@@ -97,6 +97,24 @@ class ParserTest(unittest.TestCase):
         result = CSA.Parser.parse_str(TEST_CSA_WITH_PI)
         self.assertEqual(result[0], TEST_CSA_SUMMARY_WITH_PI)
 
+class RepetitionTest(unittest.TestCase):
+    def test_repetition_server_messages(self):
+        board = shogi.Board('4k4/9/9/9/9/9/9/9/R3K4 b - 1')
+        board.push_usi('9i9a')
+        for i in range(3):
+            for usi in ['5a5b', '9a9b', '5b5a', '9b9a']:
+                board.push_usi(usi)
+        self.assertEqual(CSA.repetition_server_messages(board), [CSA.OUTE_SENNICHITE, CSA.WIN])
+        self.assertEqual(CSA.repetition_server_messages(board, shogi.BLACK), [CSA.OUTE_SENNICHITE, CSA.LOSE])
+        board.pop()
+        self.assertIsNone(CSA.repetition_server_messages(board))
+
+        board = shogi.Board('4k4/9/9/9/9/9/9/9/R3K4 w - 1')
+        for i in range(3):
+            for usi in ['5a5b', '9i9h', '5b5a', '9h9i']:
+                board.push_usi(usi)
+        self.assertEqual(CSA.repetition_server_messages(board), [CSA.SENNICHITE, CSA.DRAW])
+
 TEST_SUMMARY = {
     'names': ['kiki_no_onaka_black', 'kiki_no_omata_white'],
     'sfen': 'lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL b - 1',
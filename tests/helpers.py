@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the python-shogi library.
+# Copyright (C) 2015- Tasuku SUENAGA <tasuku-s-github@titech.ac>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Fixtures shared by the tests.
+
+from __future__ import unicode_literals
+
+import random
+import shogi
+
+TEST_CSA = '''V2.2
+N+NAKAHARA
+N-YONENAGA
+P1-KY-KE-GI-KI-OU-KI-GI-KE-KY
+P2 * -HI *  *  *  *  * -KA * 
+P3-FU-FU-FU-FU-FU-FU-FU-FU-FU
+P4 *  *  *  *  *  *  *  *  * 
+P5 *  *  *  *  *  *  *  *  * 
+P6 *  *  *  *  *  *  *  *  * 
+P7+FU+FU+FU+FU+FU+FU+FU+FU+FU
+P8 * +KA *  *  *  *  * +HI * 
+P9+KY+KE+GI+KI+OU+KI+GI+KE+KY
++
++2726FU
+-3334FU
++7776FU
+%TORYO
+'''
+
+def random_walk(board, seed, plies):
+    '''
+    Makes up to `plies` random legal moves on the board, stopping early if
+    there are none, and yields each move after making it.
+    '''
+    rand = random.Random(seed)
+    for i in range(plies):
+        moves = list(board.legal_moves)
+        if not moves:
+            return
+        move = rand.choice(moves)
+        board.push(move)
+        yield move
+
+def random_game(seed, plies):
+    '''Returns a board after a random game from the starting position.'''
+    board = shogi.Board()
+    for move in random_walk(board, seed, plies):
+        pass
+    return board
@@ -18,6 +18,8 @@
 
 from __future__ import unicode_literals
 
+import copy
+import pickle
 import shogi
 import unittest
 
@@ -26,5 +28,49 @@ class MoveTestCase(unittest.TestCase):
         move = shogi.Move.from_usi('9a9b')
         self.assertEqual(move.__hash__(), 9)
 
+    def test_int(self):
+        for usi in ['7g7f', '8h2b+', 'P*5e', 'R*1a', '0000']:
+            move = shogi.Move.from_usi(usi)
+            move_int = move.to_int()
+            self.assertEqual(shogi.Move.from_int(move_int), move)
+            self.assertEqual(shogi.move_int_to_usi(move_int), usi)
+            self.assertEqual(shogi.move_int_from_usi(usi), move_int)
+        self.assertEqual(shogi.Move.null().to_int(), shogi.MOVE_INT_NULL)
+        self.assertEqual(shogi.Move.from_usi('8h2b+').to_int(), shogi.Move.from_usi('8h2b+').__hash__())
+        with self.assertRaises(ValueError):
+            shogi.move_int_from_usi('0j1a')
+
+    def test_interned(self):
+        for usi in ['7g7f', '8h2b+', 'P*5e', 'R*1a', '0000']:
+            move = shogi.Move.from_usi(usi)
+            self.assertIs(shogi.Move.from_usi(usi), move)
+            self.assertIs(shogi.MOVES_BY_USI[usi], move)
+            self.assertIs(shogi.Move.from_int(move.to_int()), move)
+            self.assertIs(shogi.Move.get(move.from_square, move.to_square, move.promotion, move.drop_piece_type), move)
+        self.assertIs(shogi.Move.from_usi('p*5e'), shogi.Move.from_usi('P*5e'))
+        self.assertIs(shogi.Move.null(), shogi.Move.from_usi('0000'))
+
+        board = shogi.Board()
+        for move in board.legal_moves:
+            self.assertIs(shogi.Move.from_usi(move.usi()), move)
+
+        with self.assertRaises(AttributeError):
+            shogi.Move.from_usi('7g7f').comment = ''
+
+    def test_immutable(self):
+        move = shogi.Move.from_usi('7g7f')
+        with self.assertRaises(AttributeError):
+            move.from_square = shogi.A1
+        with self.assertRaises(AttributeError):
+            move.promotion = True
+        with self.assertRaises(AttributeError):
+            del move.to_square
+        self.assertEqual(move.usi(), '7g7f')
+        with self.assertRaises(TypeError):
+            shogi.MOVES_BY_USI['7g7f'] = shogi.Move.from_usi('2g2f')
+
+        self.assertIs(pickle.loads(pickle.dumps(move, 2)), move)
+        self.assertIs(copy.copy(move), move)
+
 if __name__ == '__main__':
     unittest.main()
@@ -19,6 +19,7 @@
 from __future__ import unicode_literals
 
 import shogi
+import shogi.perft
 import unittest
 
 def perft(board, depth):
@@ -73,5 +74,33 @@ class PerftTestCase(unittest.TestCase):
         board = shogi.Board('l7l/5bS2/p1np5/6Sk1/4p2B1/PSpPPn1G1/1P1G2g1N/2+l6/L1KN1+r3 b R3Pgs7p 1')
         self.assertEqual(perft(board, 1), 1)
 
+    def test_perft_module(self):
+        for sfen in [shogi.STARTING_SFEN,
+                     '4k4/9/9/9/9/9/9/9/9 b 16P 1',
+                     'l7l/5bS2/p1np5/6Sk1/4p2B1/PSpPPn1G1/1P1G2g1N/2+l6/L1KN1+r3 b R3Pgs7p 1']:
+            board = shogi.Board(sfen)
+            for depth in range(1, 3):
+                self.assertEqual(shogi.perft.perft(board, depth), perft(board, depth))
+            self.assertEqual(board.sfen(), sfen)
+
+        board = shogi.Board('4k4/9/9/9/9/9/9/9/4K4 b - 1')
+        hash_table = shogi.perft.PerftHashTable(1 << 12)
+        self.assertEqual(shogi.perft.perft(board, 5, hash_table), shogi.perft.perft(board, 5))
+        self.assertTrue(hash_table.hits > 0)
+
+        board = shogi.Board('4k4/9/9/9/9/9/9/9/9 b 16P 1')
+        counts = shogi.perft.divide(board, 2)
+        self.assertEqual(len(counts), 72)
+        self.assertEqual(sum(counts.values()), 355)
+        self.assertEqual(counts[shogi.Move.from_usi('P*5c')], 4)
+
+    def test_parallel_perft(self):
+        board = shogi.Board('l7l/5bS2/p1np5/6Sk1/4p2B1/PSpPPn1G1/1P1G2g1N/2+l6/L1KN1+r3 w R3Pgs7p 1')
+        depth, units = shogi.perft.split(board, 3, 8)
+        self.assertEqual(depth, 2)
+        self.assertEqual(sum(units.values()), shogi.perft.perft(board, 1))
+        self.assertEqual(shogi.perft.parallel_perft(board, 3, processes=2, units_per_process=4, hash_size=1024),
+                         shogi.perft.perft(board, 3))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the python-shogi library.
+# Copyright (C) 2015- Tasuku SUENAGA <tasuku-s-github@titech.ac>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import os
+import sys
+import pickle
+import numbers
+import subprocess
+import shogi
+import unittest
+from shogi import CSA
+from shogi.record import GameRecord
+from helpers import TEST_CSA, random_game
+
+class Integer(object):
+    def __init__(self, value):
+        self.value = value
+
+    def __int__(self):
+        return self.value
+
+numbers.Integral.register(Integer)
+
+class GameRecordTestCase(unittest.TestCase):
+    def test_from_summary(self):
+        summary = CSA.Parser.parse_str(TEST_CSA)[0]
+        game = GameRecord.from_summaries([summary])[0]
+        self.assertEqual(len(game), 3)
+        self.assertEqual(game.names, ('NAKAHARA', 'YONENAGA'))
+        self.assertEqual(game.win, 'b')
+        self.assertEqual(game.to_summary(), summary)
+        self.assertEqual(game.summary, summary)
+        self.assertEqual(game.summary['moves'], ['2g2f', '3c3d', '7g7f'])
+        self.assertEqual(game.position_at(-1).sfen(),
+                         'lnsgkgsnl/1r5b1/pppppp1pp/6p2/9/2P4P1/PP1PPPP1P/1B5R1/LNSGKGSNL w - 4')
+
+    def test_compact(self):
+        moves = ['7g7f', '3c3d', '8h2b+', '3a2b', 'B*4e']
+        sfen = ''.join(['lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL', ' b - 1'])
+        game = GameRecord(sfen, moves, ['sente', 'gote'], 'w', [1, 2, 3, 4, 5])
+        other = GameRecord(''.join([sfen]), [shogi.Move.from_usi(usi) for usi in moves], ['sente', 'gote'])
+
+        self.assertFalse(hasattr(game, '__dict__'))
+        self.assertEqual(game.move_ints.typecode, 'H')
+        self.assertEqual(game.move_ints, other.move_ints)
+
+        # Integers of other types, like those of numpy.
+        move_ints = [Integer(move_int) for move_int in game.move_ints]
+        self.assertEqual(GameRecord(sfen, move_ints).move_ints, game.move_ints)
+        self.assertEqual(shogi.Board(sfen).replay(move_ints).sfen(), game.position_at(-1).sfen())
+        self.assertEqual(shogi.Board(sfen).replay(move_ints, keep_history=False).sfen(), game.position_at(-1).sfen())
+        self.assertIs(game.sfen, other.sfen)
+        self.assertIs(game.names[0], other.names[0])
+        self.assertIs(GameRecord(sfen, game.move_ints).move_ints, game.move_ints)
+
+        summary = game.summary
+        self.assertEqual(sorted(summary), ['moves', 'names', 'sfen', 'times', 'win'])
+        self.assertEqual(summary['moves'], moves)
+        self.assertEqual(summary['times'], [1, 2, 3, 4, 5])
+        self.assertNotIn('times', other.summary)
+        with self.assertRaises(KeyError):
+            summary['time']
+        self.assertEqual(GameRecord.from_summary(summary).to_summary(), dict(summary))
+
+    def test_pickle(self):
+        sfen = 'lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL b - 1'
+        game = GameRecord(sfen, ['7g7f', '3c3d', '8h2b+'], ['sente', 'gote'], 'b', [1, 2, 3])
+        game.position_at(3)
+        data = pickle.dumps(game, 2)
+        loaded = pickle.loads(data)
+        self.assertEqual(loaded.to_summary(), game.to_summary())
+        if sys.version_info[0] >= 3:
+            # Python 2 only interns byte strings.
+            self.assertIs(loaded.sfen, game.sfen)
+            self.assertIs(loaded.names[1], game.names[1])
+        self.assertIsNone(loaded.checkpoints)
+        self.assertEqual(loaded.position_at(-1).sfen(), game.position_at(-1).sfen())
+
+        # Records do not depend on the state of the process that pickled them.
+        script = 'import pickle, sys; print(pickle.loads(getattr(sys.stdin, "buffer", sys.stdin).read()).sfen)'
+        process = subprocess.Popen([sys.executable, '-c', script], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+        self.assertEqual(process.communicate(data)[0].decode('ascii').strip(), sfen)
+
+    def test_position_at(self):
+        board = random_game(1, 100)
+        moves = [move.usi() for move in board.move_stack]
+        game = GameRecord(shogi.STARTING_SFEN, moves, checkpoint_interval=8)
+
+        for ply in [37, 0, len(moves), 5, 36, 38, 64, 37]:
+            expected = shogi.Board()
+            for usi in moves[:ply]:
+                expected.push_usi(usi)
+            position = game.position_at(ply)
+            self.assertFalse(position.move_stack)
+            self.assertEqual(position.sfen(), expected.sfen())
+            self.assertEqual(position.zobrist_hash(), expected.zobrist_hash())
+            self.assertEqual(set(position.legal_moves), set(expected.legal_moves))
+            position = game.position_at(ply, history=True)
+            self.assertEqual([move.usi() for move in position.move_stack], moves[:ply])
+            self.assertEqual(position.sfen(), expected.sfen())
+            self.assertEqual(position.transpositions, expected.transpositions)
+        self.assertEqual(sorted(game.checkpoints), list(range(0, len(moves) + 1, 8)))
+        self.assertEqual(game.checkpoints[32], game.position_at(32).packed_position())
+
+        # Changing a returned board does not change the checkpoints.
+        position = game.position_at(40)
+        sfen = position.sfen()
+        position.push_usi(moves[40])
+        self.assertEqual(game.position_at(40).sfen(), sfen)
+
+        with self.assertRaises(IndexError):
+            game.position_at(len(moves) + 1)
+
+    def test_positions(self):
+        board = random_game(2, 60)
+        moves = [move.usi() for move in board.move_stack]
+        game = GameRecord(shogi.STARTING_SFEN, moves, checkpoint_interval=10)
+        sfens = [position.sfen() for position in game.positions()]
+        self.assertEqual(len(sfens), len(moves) + 1)
+        self.assertEqual(sfens[0], shogi.STARTING_SFEN)
+        self.assertEqual(sfens[-1], board.sfen())
+        self.assertEqual(sorted(game.checkpoints), list(range(0, len(moves) + 1, 10)))
+        self.assertEqual(game.position_at(25).sfen(), sfens[25])
+
+if __name__ == '__main__':
+    unittest.main()